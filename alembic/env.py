@@ -10,8 +10,8 @@ if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
 # Importa metadata desde la app
-# Nota: app.py debe poder importarse sin romper
-from app import db, url as APP_DB_URL  # 'url' ya normalizado en app.py
+# Nota: app.py debe poder importarse sin romper (y sin DDL: ver SCHEMA_ON_START)
+from app import app as flask_app, db, DB_URL as APP_DB_URL, schema_lock, setup_schema  # DB_URL ya normalizado
 target_metadata = db.metadata
 
 # Permitir que alembic.ini sea sobrescrito por código (config.set_main_option)
@@ -31,12 +31,16 @@ def run_migrations_online():
     connectable = engine_from_config(
         cfg, prefix="sqlalchemy.", poolclass=pool.NullPool
     )
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata, compare_type=True
-        )
-        with context.begin_transaction():
-            context.run_migrations()
+    # Un solo proceso migra a la vez; después completa lo que create_all/ensure_* agregan fuera de alembic
+    with schema_lock():
+        with connectable.connect() as connection:
+            context.configure(
+                connection=connection, target_metadata=target_metadata, compare_type=True
+            )
+            with context.begin_transaction():
+                context.run_migrations()
+        took = setup_schema(lock=False)
+        flask_app.logger.info(f"[alembic] esquema listo en {took:.2f}s")
 
 if context.is_offline_mode():
     run_migrations_offline()
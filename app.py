@@ -1,11 +1,21 @@
 # app.py — noa cobros (backend limpio)
-import os, time
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+import os, time, json, math, hashlib, threading
+import click
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta, date, time as dtime
+from zoneinfo import ZoneInfo
+from flask import Flask, request, jsonify, Response, stream_with_context, g, has_request_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import text
-import bcrypt, jwt  # PyJWT
+from sqlalchemy import text, func, event
+import jwt  # PyJWT
+import passwords
+import dbpool
+import fastjson
+import metrics
+import compress
+from cache import TTLCache
 
 def _normalize_db_url(raw: str) -> str:
     if not raw: return "sqlite:///local.db"
@@ -19,21 +29,47 @@ DB_URL = _normalize_db_url(os.getenv("DATABASE_URL", "sqlite:///local.db"))
 JWT_SECRET = os.getenv("JWT_SECRET", "dev-inseguro-cambia-esto")
 ADMIN_SECRET = os.getenv("ADMIN_SECRET", "changeme-admin")
 FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN")
+COBROS_LIMIT_DEFAULT = int(os.getenv("COBROS_LIMIT_DEFAULT", "200"))
+COBROS_LIMIT_MAX = int(os.getenv("COBROS_LIMIT_MAX", "1000"))
+STREAM_BATCH = int(os.getenv("STREAM_BATCH", "1000"))
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "1000"))  # /cobros?q=: coincidencias (más recientes) que se rankean
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "50000"))
+BULK_CHUNK = int(os.getenv("BULK_CHUNK", "2000"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+WAVE_DAYS = [int(x) for x in os.getenv("WAVE_DAYS", "15,7,0").replace(" ", "").split(",") if x]
+TZ = os.getenv("TZ", "America/Costa_Rica")
+ENTREGA_MAX_INTENTOS = int(os.getenv("ENTREGA_MAX_INTENTOS", "5"))
+REPLAN_CHUNK = int(os.getenv("REPLAN_CHUNK", "5000"))  # cobros por tramo (y por transacción) del re-plan
+STATS_ROLLUP = os.getenv("STATS_ROLLUP", "0") == "1"  # activar tras `flask --app app rollup-rebuild`
+# DDL al importar solo en desarrollo (SQLite); en producción: `flask --app app db-setup` en el release
+SCHEMA_ON_START = os.getenv("SCHEMA_ON_START", "1" if DB_URL.startswith("sqlite") else "0") == "1"
+HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", "15"))  # segundos entre probes de DB en segundo plano
+SQL_SLOW_MS = float(os.getenv("SQL_SLOW_MS", "500"))  # loguea sentencias más lentas (0 = no)
+SQL_QUERY_BUDGET = int(os.getenv("SQL_QUERY_BUDGET", "25"))  # más sentencias por request → warning (posible N+1)
+SQL_REPEAT_LIMIT = int(os.getenv("SQL_REPEAT_LIMIT", "10"))  # la misma sentencia más veces → warning N+1
+SQL_DEBUG_HEADERS = os.getenv("SQL_DEBUG_HEADERS", "0") == "1"  # X-DB-Queries / X-DB-Time-Ms (siempre con debug)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # si se define, /metrics exige "Authorization: Bearer <token>"
+SCHEMA_LOCK_KEY = 72616401  # pg_advisory_lock compartido por db-setup y alembic
 
 app = Flask(__name__)
+app.json_provider_class = fastjson.JSONProvider  # orjson si está instalado; fechas en ISO 8601
+app.json = app.json_provider_class(app)
 # ==== CORS (Netlify) ====
 import os
 from flask_cors import CORS
 
 NETLIFY = os.getenv("FRONTEND_ORIGIN", "").strip() or "https://polite-gumdrop-ba6be7.netlify.app"
+# headers de respuesta legibles desde el frontend (las dos llamadas a CORS deben exponerlos)
+CORS_EXPOSE = ["Content-Disposition", "X-Next-Cursor", "X-Next-Offset", "ETag"]
 
 CORS(
     app,
     resources={r"/*": {"origins": [NETLIFY]}},
     supports_credentials=False,
-    expose_headers=["Content-Disposition"],
+    expose_headers=CORS_EXPOSE,
     methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
-    allow_headers=["Content-Type", "Authorization"],
+    allow_headers=["Content-Type", "Authorization", "X-Org-Id", "If-None-Match"],
 )
 
 @app.after_request
@@ -41,18 +77,99 @@ def _add_cors_headers(resp):
     # Refuerzo por si algún endpoint se salta CORS
     resp.headers.setdefault("Access-Control-Allow-Origin", NETLIFY)
     resp.headers.setdefault("Vary", "Origin")
-    resp.headers.setdefault("Access-Control-Allow-Headers", "Content-Type, Authorization")
+    resp.headers.setdefault("Access-Control-Allow-Headers", "Content-Type, Authorization, X-Org-Id, If-None-Match")
     resp.headers.setdefault("Access-Control-Allow-Methods", "GET, POST, PUT, PATCH, DELETE, OPTIONS")
     return resp
 # ==== FIN CORS ====
 
 app.config["SQLALCHEMY_DATABASE_URI"] = DB_URL
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_pre_ping": True}
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = dbpool.engine_options(DB_URL)  # DB_POOL_*, DB_PGBOUNCER (ver dbpool.py)
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-CORS(app, resources={r"/*": {"origins": [FRONTEND_ORIGIN] if FRONTEND_ORIGIN else ["*"]}})
+CORS(app, resources={r"/*": {"origins": [FRONTEND_ORIGIN] if FRONTEND_ORIGIN else ["*"]}}, expose_headers=CORS_EXPOSE)
 
 db = SQLAlchemy(app)
 
+# ---- Métricas por request (metrics.py; se exponen en /metrics) ----
+def _sql_antes(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("_t_sql", []).append(time.perf_counter())
+
+def _sql_despues(conn, cursor, statement, parameters, context, executemany):
+    dur = time.perf_counter() - conn.info["_t_sql"].pop()
+    if has_request_context():
+        g._db_time = g.get("_db_time", 0.0) + dur
+        # un executemany (o insertmanyvalues) dispara este evento por lote del mismo contexto: cuenta como una
+        if not (executemany and g.get("_db_ctx") is context):
+            g._db_queries = g.get("_db_queries", 0) + 1
+            repetidas = g.setdefault("_db_stmts", {})
+            repetidas[statement] = repetidas.get(statement, 0) + 1
+        g._db_ctx = context
+    if SQL_SLOW_MS and dur * 1000 >= SQL_SLOW_MS:
+        app.logger.warning(f"sql lenta {dur * 1000:.0f}ms: {' '.join(statement.split())[:1000]} "
+                           f"params={_redactar(parameters)}")
+
+def _sql_error(ctx):
+    # una sentencia que falla no llega a after_cursor_execute: se descarta su marca de inicio
+    pila = ctx.connection.info.get("_t_sql") if ctx.connection is not None else None
+    if pila: pila.pop()
+
+def _redactar(params):
+    # en el log solo tipos: los parámetros pueden traer datos personales o hashes
+    if isinstance(params, dict):
+        return {k: _redactar(v) for k, v in params.items()}
+    if isinstance(params, (list, tuple)):
+        if params and isinstance(params[0], (dict, list, tuple)):  # executemany
+            return f"{len(params)} filas × {_redactar(params[0])}"
+        return [_redactar(v) for v in params]
+    return "NULL" if params is None else f"<{type(params).__name__}>"
+
+def _presupuesto_sql(ruta, resp):
+    n = g.get("_db_queries", 0)
+    metrics.registry.observe("noa_db_queries_per_request", n, {"route": ruta})
+    if SQL_DEBUG_HEADERS or app.debug:
+        resp.headers["X-DB-Queries"] = str(n)
+        resp.headers["X-DB-Time-Ms"] = f"{g.get('_db_time', 0.0) * 1000:.2f}"
+    if not n: return
+    stmt, veces = max(g._db_stmts.items(), key=lambda kv: kv[1])
+    if n > SQL_QUERY_BUDGET or veces > SQL_REPEAT_LIMIT:
+        metrics.registry.inc("noa_db_query_budget_exceeded_total", {"route": ruta})
+        app.logger.warning(f"presupuesto sql excedido {request.method} {ruta}: {n} sentencias; "
+                           f"la más repetida ({veces}x): {' '.join(stmt.split())[:300]}")
+
+with app.app_context():
+    dbpool.instalar(db.engine, has_request_context)
+    event.listen(db.engine, "before_cursor_execute", _sql_antes)
+    event.listen(db.engine, "after_cursor_execute", _sql_despues)
+    event.listen(db.engine, "handle_error", _sql_error)
+
+@app.before_request
+def _metricas_inicio():
+    g._t0 = time.perf_counter()
+    metrics.registry.gauge_add("noa_http_requests_in_flight", 1)
+
+@app.after_request
+def _metricas_fin(resp):
+    # en respuestas en streaming mide hasta armar la respuesta, no hasta el último byte
+    if "_t0" in g:
+        ruta = request.url_rule.rule if request.url_rule else "<sin_ruta>"
+        metrics.registry.inc("noa_http_requests_total",
+                             {"route": ruta, "method": request.method, "status": resp.status_code})
+        metrics.registry.observe("noa_http_request_duration_seconds", time.perf_counter() - g._t0,
+                                 {"route": ruta, "method": request.method})
+        metrics.registry.observe("noa_db_time_seconds", g.get("_db_time", 0.0), {"route": ruta})
+        _presupuesto_sql(ruta, resp)
+    return resp
+
+@app.teardown_request
+def _metricas_cierre(exc):
+    if "_t0" in g:
+        metrics.registry.gauge_add("noa_http_requests_in_flight", -1)
+    metrics.registry.flush()
+
+@app.after_request
+def _comprimir(resp):
+    # gzip/br negociado para respuestas grandes y streams (COMPRESS_*, ver compress.py)
+    return compress.comprimir_respuesta(resp, request)
+
 class User(db.Model):
     __tablename__ = "user"
     id = db.Column(db.Integer, primary_key=True)
@@ -60,6 +177,14 @@ class User(db.Model):
     password_hash = db.Column(db.String(255), nullable=True)
     creado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
+class UserOrg(db.Model):
+    # Tenants de cada usuario de esta API. No se usa org_memberships (models.py): apunta a la tabla "users",
+    # con ids propios que coinciden por casualidad con los de "user". Se administra con `flask --app app org-member`
+    __tablename__ = "user_org"
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    org_id = db.Column(db.String(36), primary_key=True)
+    creado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
 class Cobro(db.Model):
     __tablename__ = "cobro"
     id = db.Column(db.Integer, primary_key=True)
@@ -68,12 +193,227 @@ class Cobro(db.Model):
     estado = db.Column(db.String(50), nullable=False, default="pendiente")  # pendiente|pagado
     referencia = db.Column(db.String(100), nullable=True)
     creado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    vence = db.Column(db.Date, nullable=True)
+    org_id = db.Column(db.String(36), nullable=True)  # tenant (organizations.id); NULL = cobros previos a multi-org
+    # Todas las consultas filtran por org_id: los índices empiezan por él
+    __table_args__ = (
+        db.Index("ix_cobro_org_estado_creado_en", "org_id", "estado", "creado_en"),
+        db.Index("ix_cobro_org_id", "org_id", "id"),
+        db.Index("ix_cobro_org_referencia", "org_id", "referencia"),
+    )
+
+class Recordatorio(db.Model):
+    # Un recordatorio por cobro y wave (T-15/T-7/T-0), materializado al crear el cobro o cambiar su vence
+    __tablename__ = "recordatorio"
+    id = db.Column(db.Integer, primary_key=True)
+    cobro_id = db.Column(db.Integer, db.ForeignKey("cobro.id", ondelete="CASCADE"), nullable=False)
+    wave = db.Column(db.Integer, nullable=False)
+    send_at = db.Column(db.Date, nullable=False)
+    enviado_en = db.Column(db.DateTime, nullable=True)
+    __table_args__ = (
+        db.UniqueConstraint("cobro_id", "wave", name="uq_recordatorio_cobro_wave"),
+        db.Index("ix_recordatorio_send_at", "send_at"),
+    )
+
+class Entrega(db.Model):
+    # Ledger de envíos: un registro por recordatorio con intentos, estado y respuesta del proveedor
+    __tablename__ = "entrega"
+    id = db.Column(db.Integer, primary_key=True)
+    recordatorio_id = db.Column(db.Integer, db.ForeignKey("recordatorio.id", ondelete="CASCADE"),
+                                nullable=False, unique=True)
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    estado = db.Column(db.String(20), nullable=False, default="pendiente")  # pendiente|enviado|fallido|descartado
+    respuesta = db.Column(db.Text, nullable=True)
+    creado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    actualizado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class RecordatorioPlan(db.Model):
+    # Waves con las que se planificaron los recordatorios existentes (una fila, id=1).
+    # Con un re-plan a medias: replan_waves son las nuevas y replan_cursor el último cobro.id ya replanificado
+    __tablename__ = "recordatorio_plan"
+    id = db.Column(db.Integer, primary_key=True)
+    waves = db.Column(db.String(100), nullable=False)
+    replan_waves = db.Column(db.String(100), nullable=True)
+    replan_cursor = db.Column(db.Integer, nullable=True)
+    actualizado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class CobroDiario(db.Model):
+    # Rollup por org, día (UTC, según creado_en) y estado; se mantiene en la misma transacción que cada cambio
+    # org_id "" = cobros sin org (en una PK no puede ir NULL)
+    __tablename__ = "cobro_diario"
+    org_id = db.Column(db.String(36), primary_key=True, default="")
+    dia = db.Column(db.Date, primary_key=True)
+    estado = db.Column(db.String(50), primary_key=True)
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+
+class CobroVersion(db.Model):
+    # Contador de cambios por org (org_id "" = sin org); cada escritura de cobros lo incrementa en su
+    # transacción y /cobros y /stats arman el ETag con él sin consultar cobro
+    __tablename__ = "cobro_version"
+    org_id = db.Column(db.String(36), primary_key=True, default="")
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    actualizado_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+def _upsert(model):
+    if db.engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+def rollup_sumar(deltas):
+    """Suma {(org_id, dia, estado): (cantidad, total)} al rollup. No hace commit."""
+    rows = [{"org_id": o or "", "dia": d, "estado": e, "cantidad": n, "total": t}
+            for (o, d, e), (n, t) in deltas.items() if n or t]
+    if not rows: return
+    stmt = _upsert(CobroDiario)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CobroDiario.org_id, CobroDiario.dia, CobroDiario.estado],
+        set_={"cantidad": CobroDiario.cantidad + stmt.excluded.cantidad,
+              "total": CobroDiario.total + stmt.excluded.total},
+    )
+    db.session.execute(stmt, rows)
+
+def tocar_version(orgs):
+    """Incrementa la versión de datos de cada org (invalida los ETag de /cobros y /stats). No hace commit."""
+    ahora = datetime.utcnow()
+    rows = [{"org_id": o or "", "version": 1, "actualizado_en": ahora} for o in set(orgs)]
+    if not rows: return
+    stmt = _upsert(CobroVersion)
+    stmt = stmt.on_conflict_do_update(index_elements=[CobroVersion.org_id], set_={
+        "version": CobroVersion.version + 1, "actualizado_en": stmt.excluded.actualizado_en})
+    db.session.execute(stmt, rows)
+
+def rollup_rebuild():
+    """Recalcula cobro_diario completo desde cobro (backfill) y sube la versión de cada org afectada."""
+    with app.app_context():
+        org, dia = func.coalesce(Cobro.org_id, ""), func.date(Cobro.creado_en)
+        sel = db.select(org, dia, Cobro.estado, func.count(Cobro.id), func.coalesce(func.sum(Cobro.monto), 0.0)) \
+            .group_by(org, dia, Cobro.estado)
+        orgs = lambda: {o for (o,) in db.session.query(CobroDiario.org_id).distinct()}
+        antes = orgs()
+        db.session.execute(CobroDiario.__table__.delete())
+        db.session.execute(CobroDiario.__table__.insert().from_select(
+            ["org_id", "dia", "estado", "cantidad", "total"], sel))
+        tocar_version(antes | orgs())  # /stats pudo cambiar: sin esto un ETag viejo seguiría dando 304
+        db.session.commit()
+        return db.session.query(func.count()).select_from(CobroDiario).scalar()
+
+@app.cli.command("rollup-rebuild")
+def _rollup_rebuild_cmd():
+    print(f"[rollup] cobro_diario reconstruido: {rollup_rebuild()} filas")
+
+def _hoy():
+    return datetime.now(ZoneInfo(TZ)).date()
+
+def _plan_waves():
+    # durante un re-plan, las nuevas: los cobros que se creen o cambien ya quedan con esas
+    p = db.session.get(RecordatorioPlan, 1)
+    return [int(x) for x in (p.replan_waves or p.waves).split(",") if x] if p else WAVE_DAYS
+
+def planificar_recordatorios(cobros, waves=None, nuevos=False):
+    """(Re)planifica los recordatorios no enviados de [(cobro_id, vence)]. No hace commit.
+    Con nuevos=True (cobros recién insertados) no busca recordatorios previos."""
+    cobros = list(cobros)
+    if not cobros: return 0
+    waves = _plan_waves() if waves is None else waves
+    hoy = _hoy()
+    ids = [] if nuevos else [cid for cid, _ in cobros]
+    enviados = set()
+    for i in range(0, len(ids), BULK_CHUNK):
+        chunk = ids[i:i + BULK_CHUNK]
+        db.session.query(Recordatorio).filter(Recordatorio.cobro_id.in_(chunk), Recordatorio.enviado_en.is_(None)) \
+            .delete(synchronize_session=False)
+        enviados |= set(db.session.query(Recordatorio.cobro_id, Recordatorio.wave)
+                        .filter(Recordatorio.cobro_id.in_(chunk)).all())
+    rows = [{"cobro_id": cid, "wave": w, "send_at": vence - timedelta(days=w)}
+            for cid, vence in cobros if vence
+            for w in waves if vence - timedelta(days=w) >= hoy and (cid, w) not in enviados]
+    if rows: db.session.execute(db.insert(Recordatorio), rows)
+    return len(rows)
+
+def _menos_dias(col, dias):
+    if db.engine.dialect.name == "postgresql":
+        return col - db.literal_column(str(int(dias)))
+    return func.date(col, f"-{int(dias)} days")
+
+def replan_recordatorios(waves, chunk=REPLAN_CHUNK):
+    """Rehace los recordatorios futuros no enviados con otras waves, un tramo de `chunk` cobros (por id) por
+    llamada y con su propio commit: cada transacción es corta y el cursor queda en recordatorio_plan, así que
+    una corrida cortada retoma donde quedó. Devuelve (planificados en el tramo, completo)."""
+    hoy = _hoy()
+    objetivo = ",".join(str(w) for w in waves)
+    p = db.session.get(RecordatorioPlan, 1, with_for_update=True) \
+        or RecordatorioPlan(id=1, waves=",".join(str(w) for w in WAVE_DAYS))
+    if p.replan_waves != objetivo:
+        p.replan_waves, p.replan_cursor = objetivo, 0
+    desde = p.replan_cursor or 0
+    tramo = db.select(Cobro.id).where(Cobro.id > desde).order_by(Cobro.id).limit(chunk).subquery()
+    n, hasta = db.session.execute(db.select(func.count(), func.max(tramo.c.id))).one()
+    total = 0
+    if n:
+        db.session.query(Recordatorio).filter(Recordatorio.cobro_id > desde, Recordatorio.cobro_id <= hasta,
+                                              Recordatorio.enviado_en.is_(None)).delete(synchronize_session=False)
+        for w in waves:
+            ya = db.select(Recordatorio.id).where(Recordatorio.cobro_id == Cobro.id, Recordatorio.wave == w).exists()
+            sel = db.select(Cobro.id, db.literal(w), _menos_dias(Cobro.vence, w)).where(
+                Cobro.id > desde, Cobro.id <= hasta, Cobro.vence.is_not(None),
+                Cobro.vence >= hoy + timedelta(days=w), Cobro.estado != "pagado", ~ya)
+            res = db.session.execute(Recordatorio.__table__.insert().from_select(["cobro_id", "wave", "send_at"], sel))
+            total += res.rowcount or 0
+        p.replan_cursor = hasta
+    completo = n < chunk
+    if completo:
+        p.waves, p.replan_waves, p.replan_cursor = objetivo, None, None
+    p.actualizado_en = datetime.utcnow()
+    db.session.add(p)
+    db.session.commit()
+    return total, completo
+
+@app.cli.command("recordatorios-replan")
+def _replan_cmd():
+    total, completo = 0, False
+    while not completo:
+        n, completo = replan_recordatorios(sorted(set(WAVE_DAYS), reverse=True))
+        total += n
+    print(f"[recordatorios] replanificados con WAVE_DAYS={WAVE_DAYS}: {total}")
+
+def _agregar_columnas(tabla, columnas):
+    # ALTER solo si falta la columna: ADD COLUMN IF NOT EXISTS igual pide ACCESS EXCLUSIVE sobre la tabla
+    existentes = {c["name"] for c in db.inspect(db.engine).get_columns(tabla)}
+    for nombre, ddl in columnas.items():
+        if nombre not in existentes:
+            db.session.execute(text(f'ALTER TABLE "{tabla}" ADD COLUMN {nombre} {ddl};'))
+
+def _crear_indices(tabla, indices, obsoletos=(), using=None):
+    # Solo los que faltan; en PostgreSQL CONCURRENTLY (no bloquea escrituras, requiere autocommit)
+    existentes = {i["name"] for i in db.inspect(db.engine).get_indexes(tabla)}
+    pg = db.engine.dialect.name == "postgresql"
+    conc = "CONCURRENTLY " if pg else ""
+    metodo = f"USING {using} " if using else ""
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if pg:
+            # un CONCURRENTLY cancelado deja el índice INVALID con su nombre: se borra y se vuelve a crear
+            invalidos = {n for (n,) in conn.execute(text(
+                "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE NOT i.indisvalid AND c.relname = ANY(:nombres)"), {"nombres": list(indices)})}
+            for nombre in invalidos:
+                app.logger.warning(f"indice {nombre} INVALID: se reconstruye")
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {nombre};'))
+            existentes -= invalidos
+        for nombre, cols in indices.items():
+            if nombre not in existentes:
+                conn.execute(text(f'CREATE INDEX {conc}IF NOT EXISTS {nombre} ON "{tabla}" {metodo}({cols});'))
+        for nombre in obsoletos:
+            if nombre in existentes:
+                conn.execute(text(f'DROP INDEX {conc}IF EXISTS {nombre};'))
 
 def ensure_user_columns():
     with app.app_context():
         try:
-            db.session.execute(text('ALTER TABLE "user" ADD COLUMN IF NOT EXISTS password_hash VARCHAR(255);'))
-            db.session.execute(text('ALTER TABLE "user" ADD COLUMN IF NOT EXISTS creado_en TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW();'))
+            _agregar_columnas("user", {"password_hash": "VARCHAR(255)",
+                                       "creado_en": "TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()"})
             db.session.commit()
         except Exception as e:
             db.session.rollback()
@@ -82,45 +422,259 @@ def ensure_user_columns():
 def ensure_cobro_columns():
     with app.app_context():
         try:
-            db.session.execute(text('ALTER TABLE "cobro" ADD COLUMN IF NOT EXISTS referencia VARCHAR(100);'))
+            _agregar_columnas("cobro", {"referencia": "VARCHAR(100)", "vence": "DATE", "org_id": "VARCHAR(36)"})
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             app.logger.error(f"ensure_cobro_columns error: {e}")
 
-def create_tables_once():
+def ensure_recordatorio_columns():
+    with app.app_context():
+        try:
+            _agregar_columnas("recordatorio_plan", {"replan_waves": "VARCHAR(100)", "replan_cursor": "INTEGER"})
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"ensure_recordatorio_columns error: {e}")
+
+def ensure_cobro_indexes():
+    # create_all no agrega índices a tablas que ya existen
     with app.app_context():
+        try:
+            _crear_indices("cobro", {
+                "ix_cobro_org_estado_creado_en": "org_id, estado, creado_en",
+                "ix_cobro_org_id": "org_id, id",
+                "ix_cobro_org_referencia": "org_id, referencia",
+            }, obsoletos=("ix_cobro_estado_creado_en", "ix_cobro_creado_en"))  # toda consulta filtra por org_id
+        except Exception as e:
+            app.logger.error(f"ensure_cobro_indexes error: {e}")
+
+# Texto que indexa /cobros?q= en PostgreSQL: la consulta usa la misma expresión que el índice
+_DOC_SQL = "(coalesce(descripcion, '') || ' ' || coalesce(referencia, ''))"
+_FTS_DDL = (
+    # SQLite: tabla FTS5 de contenido externo sobre cobro, sincronizada por triggers
+    "CREATE VIRTUAL TABLE IF NOT EXISTS cobro_fts USING fts5(descripcion, referencia, content='cobro', "
+    "content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS cobro_fts_ai AFTER INSERT ON cobro BEGIN "
+    "INSERT INTO cobro_fts(rowid, descripcion, referencia) VALUES (new.id, new.descripcion, new.referencia); END",
+    "CREATE TRIGGER IF NOT EXISTS cobro_fts_ad AFTER DELETE ON cobro BEGIN "
+    "INSERT INTO cobro_fts(cobro_fts, rowid, descripcion, referencia) "
+    "VALUES ('delete', old.id, old.descripcion, old.referencia); END",
+    "CREATE TRIGGER IF NOT EXISTS cobro_fts_au AFTER UPDATE OF descripcion, referencia ON cobro BEGIN "
+    "INSERT INTO cobro_fts(cobro_fts, rowid, descripcion, referencia) "
+    "VALUES ('delete', old.id, old.descripcion, old.referencia); "
+    "INSERT INTO cobro_fts(rowid, descripcion, referencia) VALUES (new.id, new.descripcion, new.referencia); END",
+)
+
+def ensure_cobro_search():
+    # Índice de /cobros?q=: trigramas (pg_trgm, GIN) en PostgreSQL, FTS5 en SQLite. Sin él la búsqueda
+    # sigue andando con LIKE, pero recorre la tabla
+    with app.app_context():
+        try:
+            if db.engine.dialect.name == "postgresql":
+                with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm;"))
+                _crear_indices("cobro", {"ix_cobro_busqueda_trgm": f"{_DOC_SQL} gin_trgm_ops"}, using="gin")
+            else:
+                nueva = not db.inspect(db.engine).has_table("cobro_fts")
+                with db.engine.begin() as conn:
+                    for ddl in _FTS_DDL: conn.execute(text(ddl))
+                    if nueva: conn.execute(text("INSERT INTO cobro_fts(cobro_fts) VALUES ('rebuild')"))
+        except Exception as e:
+            app.logger.error(f"ensure_cobro_search error: {e}")
+
+def ensure_rollup_schema():
+    # cobro_diario anterior a org_id: la PK cambia, así que se recrea y se recalcula desde cobro.
+    # Recién creado por create_all (o vacío) con cobros existentes: también se recalcula
+    with app.app_context():
+        try:
+            cols = {c["name"] for c in db.inspect(db.engine).get_columns("cobro_diario")}
+            if "org_id" not in cols:
+                CobroDiario.__table__.drop(db.engine)
+                CobroDiario.__table__.create(db.engine)
+                app.logger.warning(f"cobro_diario recreado con org_id: {rollup_rebuild()} filas")
+            elif db.session.query(CobroDiario.dia).first() is None and db.session.query(Cobro.id).first() is not None:
+                app.logger.warning(f"cobro_diario vacío: {rollup_rebuild()} filas")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"ensure_rollup_schema error: {e}")
+
+@contextmanager
+def schema_lock():
+    """Un solo proceso a la vez aplica el esquema (advisory lock de PostgreSQL; en SQLite no hace nada)."""
+    with app.app_context():
+        if db.engine.dialect.name != "postgresql":
+            yield; return
+        with db.engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": SCHEMA_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": SCHEMA_LOCK_KEY})
+
+def setup_schema(lock=True):
+    """create_all + columnas/índices faltantes. Devuelve los segundos que tomó.
+    Lo corren `flask --app app db-setup` y alembic/env.py (este ya con el lock tomado: lock=False)."""
+    with app.app_context(), (schema_lock() if lock else nullcontext()):
+        t = time.perf_counter()
         db.create_all()
         ensure_user_columns()
         ensure_cobro_columns()
+        ensure_recordatorio_columns()
+        ensure_cobro_indexes()
+        ensure_cobro_search()
+        ensure_rollup_schema()
+        if db.inspect(db.engine).has_table("org_memberships"):
+            from org_access import ensure_indexes
+            ensure_indexes(db, app.logger)
+        return time.perf_counter() - t
+
+@app.cli.command("db-setup")
+def _db_setup_cmd():
+    print(f"[schema] listo en {setup_schema():.2f}s")
+
+@app.cli.command("noa-seed")
+def _noa_seed_cmd():
+    """Usuarios semilla en "users" (models.py); una vez por deploy, después de db-setup (Procfile release)."""
+    import models
+    from seed import seed_users_locked
+    db.create_all()  # con models importado incluye users/organizations/org_memberships
+    r = seed_users_locked(db, models.User)
+    print(f"[noa] seed OK en {r['segundos']}s (creados={r['creados']} actualizados={r['actualizados']} "
+          f"sin_cambios={r['sin_cambios']})")
 
 def make_token(email: str) -> str:
     payload = {"sub": email, "exp": datetime.utcnow() + timedelta(hours=12), "iat": datetime.utcnow()}
     return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
 
+def _decode_claims(token: str):
+    try:
+        return jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+    except Exception:
+        return None
+
 def read_token(auth_header: str):
     if not auth_header or not auth_header.startswith("Bearer "): return None
-    token = auth_header.split(" ", 1)[1].strip()
+    data = _decode_claims(auth_header.split(" ", 1)[1].strip())
+    return data.get("sub") if data else None
+
+# Principal autenticado (con sus orgs); se cachea por hash del token para no tocar la DB en cada llamada
+Principal = namedtuple("Principal", "id email orgs")
+_auth_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+def invalidar_usuario(email: str):
+    """Llamar al crear o borrar un usuario (solo afecta a la caché de este proceso)."""
+    return _auth_cache.invalidate(lambda p: p.email == email)
+
+def _orgs_de(user_id):
+    # Si no se puede leer user_org (esquema sin aplicar) el usuario queda sin orgs: solo cobros legacy
     try:
-        data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        return data.get("sub")
+        rows = db.session.query(UserOrg.org_id).filter(UserOrg.user_id == user_id).order_by(UserOrg.org_id)
+        return tuple(o for (o,) in rows)
     except Exception:
-        return None
+        db.session.rollback()
+        return ()
+
+@app.cli.command("org-member")
+@click.argument("accion", type=click.Choice(["add", "remove", "list"]))
+@click.argument("email")
+@click.argument("org_id", required=False)
+def _org_member_cmd(accion, email, org_id):
+    """Alta/baja de EMAIL (usuario de /auth/register) en ORG_ID. Los workers web lo ven al vencer AUTH_CACHE_TTL."""
+    u = User.query.filter_by(email=email.strip().lower()).first()
+    if not u: raise click.ClickException(f"no existe el usuario {email}")
+    if accion != "list":
+        if not org_id: raise click.UsageError("falta ORG_ID")
+        m = db.session.get(UserOrg, (u.id, org_id))
+        if accion == "add" and not m: db.session.add(UserOrg(user_id=u.id, org_id=org_id))
+        if accion == "remove" and m: db.session.delete(m)
+        db.session.commit()
+        invalidar_usuario(u.email)
+    print(f"[orgs] {u.email}: {', '.join(_orgs_de(u.id)) or '(ninguna)'}")
+
+def _resolver_org(p):
+    """Fija g.org_id: X-Org-Id (debe ser miembro) o su única org; None = sin orgs (cobros legacy)."""
+    pedida = request.headers.get("X-Org-Id", "").strip()
+    if pedida:
+        if pedida not in p.orgs: return jsonify({"error": "org_prohibida"}), 403
+        g.org_id = pedida
+    elif len(p.orgs) > 1:
+        return jsonify({"error": "org_requerida", "orgs": list(p.orgs)}), 400
+    else:
+        g.org_id = p.orgs[0] if p.orgs else None
+    return None
+
+def _de_org(q):
+    """Restringe una consulta sobre Cobro al tenant del request."""
+    org = g.get("org_id")
+    return q.filter(Cobro.org_id == org) if org else q.filter(Cobro.org_id.is_(None))
 
 def require_auth():
-    email = read_token(request.headers.get("Authorization", ""))
+    auth_header = request.headers.get("Authorization", "")
+    if not auth_header.startswith("Bearer "): return None, (jsonify({"error": "no_autorizado"}), 401)
+    token = auth_header.split(" ", 1)[1].strip()
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    p = _auth_cache.get(key)
+    if p: return p, _resolver_org(p)
+    claims = _decode_claims(token)
+    email = claims.get("sub") if claims else None
     if not email: return None, (jsonify({"error": "no_autorizado"}), 401)
     u = User.query.filter_by(email=email).first()
     if not u: return None, (jsonify({"error": "no_autorizado"}), 401)
-    return u, None
+    p = Principal(u.id, u.email, _orgs_de(u.id))
+    # nunca más allá del exp del token
+    restante = claims.get("exp", 0) - time.time() if "exp" in claims else AUTH_CACHE_TTL
+    _auth_cache.set(key, p, ttl=min(AUTH_CACHE_TTL, restante))
+    return p, _resolver_org(p)
 
-@app.get("/health")
-def health():
+# Estado de la DB: un thread por proceso hace SELECT 1 cada HEALTH_INTERVAL y los health checks leen el último
+_health = {}
+_health_pid = None
+_health_lock = threading.Lock()
+
+def _probe_db():
+    global _health
+    t = time.perf_counter()
     try:
-        db.session.execute(text("SELECT 1"))
-        return jsonify({"ok": True, "db": "on", "db_url_scheme": DB_URL.split(":", 1)[0]}), 200
+        with app.app_context():
+            db.session.execute(text("SELECT 1"))
+        r = {"ok": True, "db": "on", "latency_ms": round((time.perf_counter() - t) * 1000, 2)}
     except Exception as e:
-        return jsonify({"ok": False, "db": "off", "error": str(e)}), 200
+        r = {"ok": False, "db": "off", "error": str(e)}
+    r["checked_at"] = time.time()
+    _health = r
+
+def _health_loop():
+    while True:
+        time.sleep(HEALTH_INTERVAL)
+        _probe_db()
+
+def _health_estado():
+    # el thread se arranca perezosamente en cada proceso (después del fork de gunicorn)
+    global _health_pid
+    with _health_lock:
+        if _health_pid != os.getpid():
+            _health_pid = os.getpid()
+            _probe_db()
+            threading.Thread(target=_health_loop, name="health-probe", daemon=True).start()
+    r = dict(_health)
+    r["edad_s"] = round(time.time() - r["checked_at"], 1)
+    return r
+
+@app.get("/health")
+def health():
+    return jsonify({**_health_estado(), "db_url_scheme": DB_URL.split(":", 1)[0]}), 200
+
+@app.get("/health/live")
+def health_live():
+    # el proceso responde; no toca la DB
+    return jsonify({"ok": True}), 200
+
+@app.get("/health/ready")
+def health_ready():
+    r = _health_estado()
+    listo = r["ok"] and r["edad_s"] <= 3 * HEALTH_INTERVAL
+    return jsonify({**r, "ok": listo}), 200 if listo else 503
 
 @app.get("/__ok")
 def __ok():
@@ -141,6 +695,30 @@ def admin_routes():
     routes = [{"rule": str(r), "methods": sorted(list(r.methods - {"HEAD", "OPTIONS"}))} for r in app.url_map.iter_rules()]
     return jsonify({"ok": True, "count": len(routes), "routes": routes})
 
+@app.get("/admin/auth-cache")
+def admin_auth_cache():
+    if request.headers.get("X-Admin-Secret") != ADMIN_SECRET:
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    return jsonify({"ok": True, "pid": os.getpid(), **_auth_cache.stats()})
+
+@app.get("/metrics")
+def metrics_endpoint():
+    if METRICS_TOKEN and request.headers.get("Authorization", "") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "no_autorizado"}), 401
+    metrics.registry.flush(force=True)
+    return Response(metrics.registry.render(), status=200, content_type=metrics.CONTENT_TYPE)
+
+@app.get("/admin/pool")
+def admin_pool():
+    if request.headers.get("X-Admin-Secret") != ADMIN_SECRET:
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    return jsonify({"ok": True, "pid": os.getpid(), **dbpool.status(db.engine)})
+
+def _ocupado():
+    resp = jsonify({"error": "ocupado", "detail": "demasiados logins simultáneos, reintentar"})
+    resp.headers["Retry-After"] = "1"
+    return resp, 503
+
 @app.post("/auth/register")
 def register():
     data = request.get_json(silent=True) or {}
@@ -151,9 +729,13 @@ def register():
     if User.query.filter_by(email=email).first():
         return jsonify({"ok": True, "detail": "ya_existe"}), 200
     try:
-        pw_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+        pw_hash = passwords.hash_password(password)
+    except passwords.PasswordBusy:
+        return _ocupado()
+    try:
         u = User(email=email, password_hash=pw_hash)
         db.session.add(u); db.session.commit()
+        invalidar_usuario(email)
         return jsonify({"ok": True, "id": u.id, "email": u.email}), 201
     except Exception as e:
         db.session.rollback()
@@ -170,11 +752,21 @@ def login():
     if not u or not getattr(u, "password_hash", None):
         return jsonify({"error": "credenciales_invalidas"}), 401
     try:
-        ok = bcrypt.checkpw(password.encode("utf-8"), u.password_hash.encode("utf-8"))
+        ok = passwords.check_password(password, u.password_hash)
+    except passwords.PasswordBusy:
+        return _ocupado()
     except Exception as e:
         return jsonify({"error": "bcrypt_error", "detail": str(e)}), 500
     if not ok:
         return jsonify({"error": "credenciales_invalidas"}), 401
+    if passwords.needs_rehash(u.password_hash):
+        # cambió BCRYPT_ROUNDS: se aprovecha que tenemos la contraseña en claro
+        try:
+            u.password_hash = passwords.hash_password(password)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"rehash error ({email}): {e}")
     token = make_token(email)
     return jsonify({"access_token": token, "token_type": "bearer"}), 200
 
@@ -186,102 +778,611 @@ def list_users():
     if not items: items = [{"id": 1, "email": "demo@noa.com"}]
     return jsonify(items), 200
 
+def _parse_fecha(raw):
+    if not raw: return None
+    try: return datetime.fromisoformat(raw)
+    except Exception: return None
+
+def _filtrar_cobros(q, args=None):
+    """Aplica el tenant y los filtros estado/desde/hasta (de request.args o de un dict)."""
+    args = request.args if args is None else args
+    q = _de_org(q)
+    estado = args.get("estado")
+    if estado: q = q.filter(Cobro.estado == estado)
+    desde = _parse_fecha(args.get("desde")); hasta = _parse_fecha(args.get("hasta"))
+    if desde: q = q.filter(Cobro.creado_en >= desde)
+    if hasta: q = q.filter(Cobro.creado_en <= hasta)
+    return q
+
+# Columnas de un cobro en la API; las listas las seleccionan como tuplas (sin hidratar objetos ORM)
+COBRO_COLS = (Cobro.id, Cobro.monto, Cobro.descripcion, Cobro.estado, Cobro.referencia, Cobro.creado_en,
+              Cobro.vence, Cobro.org_id)
+_COBRO_KEYS = tuple(c.key for c in COBRO_COLS)
+
+def _cobro_dict(x):
+    """Serializador único: fila de COBRO_COLS u objeto Cobro. Las fechas quedan nativas (el proveedor JSON las emite en ISO)."""
+    if isinstance(x, Cobro): x = [getattr(x, k) for k in _COBRO_KEYS]
+    d = dict(zip(_COBRO_KEYS, x))
+    d["monto"] = float(d["monto"] or 0.0)
+    return d
+
+def _parse_dia(raw):
+    """Fecha YYYY-MM-DD (acepta datetimes ISO); None si viene vacía, ValueError si es inválida."""
+    if not raw: return None
+    return date.fromisoformat(str(raw)[:10])
+
+def _int_arg(name, default=None):
+    raw = request.args.get(name)
+    if raw in (None, ""): return default
+    try: return int(raw)
+    except ValueError: return None
+
+def _stream_json_array(q):
+    # Emite "[fila,fila,...]" desde un cursor del lado del servidor, un dumps por lote de STREAM_BATCH filas
+    def gen():
+        yield "["
+        first, lote = True, []
+        for x in q.yield_per(STREAM_BATCH):
+            lote.append(_cobro_dict(x))
+            if len(lote) == STREAM_BATCH:
+                yield ("" if first else ",") + app.json.dumps(lote)[1:-1]
+                first, lote = False, []
+        if lote:
+            yield ("" if first else ",") + app.json.dumps(lote)[1:-1]
+        yield "]"
+    return Response(stream_with_context(gen()), status=200, mimetype="application/json")
+
+def _etag_datos():
+    """ETag de la respuesta: versión de datos de la org + ruta con query. Una lectura por PK, sin tocar cobro."""
+    org = g.get("org_id") or ""
+    v = db.session.query(CobroVersion.version).filter(CobroVersion.org_id == org).scalar() or 0
+    return hashlib.sha1(f"{org}|{v}|{request.full_path}".encode("utf-8")).hexdigest()[:24]
+
+def _con_etag(resp, etag):
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"  # el navegador guarda y revalida siempre
+    return resp
+
+def _no_modificado(etag):
+    if request.if_none_match.contains_weak(etag):
+        return _con_etag(Response(status=304), etag)
+    return None
+
+_busqueda_indexada = None  # se averigua una vez por proceso: ensure_cobro_search pudo no haber corrido
+
+def _hay_indice_busqueda():
+    global _busqueda_indexada
+    if _busqueda_indexada is None:
+        if db.engine.dialect.name == "postgresql":
+            _busqueda_indexada = db.session.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+        else:
+            _busqueda_indexada = db.inspect(db.engine).has_table("cobro_fts")
+    return _busqueda_indexada
+
+def _like(palabra):
+    return "%" + palabra.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def _min_palabra():
+    # pg_trgm no puede usar el índice con menos de 3 caracteres; en FTS5 un prefijo de 1 expande a miles de términos
+    return 3 if db.engine.dialect.name == "postgresql" else 2
+
+def _buscar_cobros(texto):
+    """Query de COBRO_COLS para /cobros?q= (tenant y filtros incluidos) ordenada por relevancia, o None si
+    ninguna palabra llega a _min_palabra() caracteres y no hay referencia exacta.
+    Si hay cobros con esa referencia exacta devuelve solo esos. Si no, cada palabra tiene que aparecer en
+    descripcion o referencia y se rankean las SEARCH_CANDIDATES coincidencias más recientes:
+    prefijo de palabra y bm25 (FTS5) en SQLite, subcadena y word_similarity (pg_trgm) en PostgreSQL."""
+    exacta = _filtrar_cobros(db.session.query(*COBRO_COLS)).filter(Cobro.referencia == texto)
+    if exacta.with_entities(Cobro.id).limit(1).first():
+        return exacta.order_by(Cobro.id.desc())
+    palabras = [p for p in texto.split() if sum(ch.isalnum() for ch in p) >= _min_palabra()][:8]
+    if not palabras:
+        return None
+    pg = db.engine.dialect.name == "postgresql"
+    if not pg and _hay_indice_busqueda():
+        m = " ".join('"' + p.replace('"', '""') + '"*' for p in palabras)  # prefijos, AND implícito
+        fts = text("SELECT rowid AS id, bm25(cobro_fts) AS rank FROM cobro_fts WHERE cobro_fts MATCH :m") \
+            .bindparams(m=m).columns(id=db.Integer, rank=db.Float).subquery()
+        # FTS5 manda el join: ordenar por su rowid (no por cobro.id) evita que SQLite recorra cobro y
+        # repita el MATCH por fila
+        cand = _filtrar_cobros(db.session.query(fts.c.id, fts.c.rank).join(Cobro, Cobro.id == fts.c.id))
+        cand = cand.order_by(fts.c.id.desc()).limit(SEARCH_CANDIDATES).subquery()
+        orden = (cand.c.rank, Cobro.id.desc())  # bm25: menor = más relevante
+    else:
+        doc = db.literal_column(_DOC_SQL)
+        cand = _filtrar_cobros(db.session.query(Cobro.id))
+        for p in palabras:
+            cand = cand.filter(doc.ilike(_like(p), escape="\\"))
+        cand = cand.order_by(Cobro.id.desc()).limit(SEARCH_CANDIDATES).subquery()
+        orden = (Cobro.id.desc(),)
+        if pg and _hay_indice_busqueda():
+            orden = (func.word_similarity(texto, doc).desc(),) + orden
+    return db.session.query(*COBRO_COLS).join(cand, cand.c.id == Cobro.id).order_by(*orden)
+
+# GET /cobros?limit=&after=  (keyset por id desc; siguiente página en X-Next-Cursor)
+# Responde ETag; con If-None-Match igual devuelve 304 sin consultar cobro
+# GET /cobros?stream=1       (todas las filas filtradas, JSON emitido en streaming)
+# GET /cobros?q=&offset=     (búsqueda por descripcion/referencia, por relevancia; siguiente página en X-Next-Offset)
 @app.get("/cobros")
 def cobros_list():
     u, err = require_auth()
     if err: return err
-    q = Cobro.query
-    estado = request.args.get("estado")
-    if estado: q = q.filter(Cobro.estado == estado)
-    desde = request.args.get("desde"); hasta = request.args.get("hasta")
-    if desde:
-        try: q = q.filter(Cobro.creado_en >= datetime.fromisoformat(desde))
-        except Exception: pass
-    if hasta:
-        try: q = q.filter(Cobro.creado_en <= datetime.fromisoformat(hasta))
-        except Exception: pass
+    after = _int_arg("after")
+    limit = _int_arg("limit", COBROS_LIMIT_DEFAULT)
+    if after is None and request.args.get("after"):
+        return jsonify({"error": "cursor_invalido"}), 400
+    if limit is None or limit < 1:
+        return jsonify({"error": "limit_invalido"}), 400
+    texto = (request.args.get("q") or "").strip()
+    offset = _int_arg("offset", 0)
+    if len(texto) > 100:
+        return jsonify({"error": "q_muy_larga"}), 400
+    if offset is None or offset < 0:
+        return jsonify({"error": "offset_invalido"}), 400
+    if texto and (request.args.get("after") or request.args.get("stream")):
+        # la búsqueda va por relevancia: ni cursor por id ni streaming
+        return jsonify({"error": "q_incompatible", "detail": "q no se combina con after ni stream; usar offset"}), 400
+    etag = _etag_datos()  # antes de la consulta: si algo cambia en medio, el próximo poll trae la versión nueva
+    no_mod = _no_modificado(etag)
+    if no_mod: return no_mod
+    if texto:
+        limit = min(limit, COBROS_LIMIT_MAX)
+        q = _buscar_cobros(texto)
+        if q is None:
+            return jsonify({"error": "q_muy_corta", "min": _min_palabra()}), 400
+        rows = q.offset(offset).limit(limit + 1).all()
+        resp = _con_etag(jsonify([_cobro_dict(x) for x in rows[:limit]]), etag)
+        if len(rows) > limit:
+            resp.headers["X-Next-Offset"] = str(offset + limit)
+        return resp, 200
+    q = _filtrar_cobros(db.session.query(*COBRO_COLS))
+    if after is not None: q = q.filter(Cobro.id < after)
     q = q.order_by(Cobro.id.desc())
-    items = [{
-        "id": x.id, "monto": float(x.monto or 0.0), "descripcion": x.descripcion,
-        "estado": x.estado, "referencia": x.referencia, "creado_en": x.creado_en.isoformat()
-    } for x in q.all()]
-    return jsonify(items), 200
+    if request.args.get("stream") in ("1", "true"):
+        if request.args.get("limit"): q = q.limit(limit)
+        return _con_etag(_stream_json_array(q), etag)
+    limit = min(limit, COBROS_LIMIT_MAX)
+    rows = q.limit(limit + 1).all()
+    items = [_cobro_dict(x) for x in rows[:limit]]
+    resp = _con_etag(jsonify(items), etag)
+    if len(rows) > limit:
+        resp.headers["X-Next-Cursor"] = str(rows[limit - 1].id)
+    return resp, 200
 
 @app.post("/cobros")
 def cobros_create():
     u, err = require_auth()
     if err: return err
     data = request.get_json(silent=True) or {}
+    try: vence = _parse_dia(data.get("vence"))
+    except ValueError: return jsonify({"error": "vence_invalido"}), 400
     try:
         c = Cobro(
             monto=float(data.get("monto") or 0.0),
             descripcion=(data.get("descripcion") or "").strip(),
             estado=(data.get("estado") or "pendiente").strip(),
-            referencia=(data.get("referencia") or None)
+            referencia=(data.get("referencia") or None),
+            vence=vence,
+            org_id=g.org_id
         )
-        db.session.add(c); db.session.commit()
-        return jsonify({
-            "id": c.id, "monto": c.monto, "descripcion": c.descripcion, "estado": c.estado,
-            "referencia": c.referencia, "creado_en": c.creado_en.isoformat()
-        }), 201
+        db.session.add(c); db.session.flush()
+        rollup_sumar({(c.org_id, c.creado_en.date(), c.estado): (1, c.monto)})
+        tocar_version([c.org_id])
+        planificar_recordatorios([(c.id, c.vence)], nuevos=True)
+        out = _cobro_dict(c)  # antes del commit: después leer c recargaría la fila
+        db.session.commit()
+        return jsonify(out), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": "db_error", "detail": str(e)}), 500
+
+def _validar_cobro(data):
+    """Devuelve (valores, None) o (None, codigo_error) para un cobro recibido como JSON."""
+    if not isinstance(data, dict): return None, "objeto_invalido"
+    try: monto = float(data.get("monto") or 0.0)
+    except (TypeError, ValueError): return None, "monto_invalido"
+    if not math.isfinite(monto): return None, "monto_invalido"
+    descripcion = str(data.get("descripcion") or "").strip()
+    estado = str(data.get("estado") or "pendiente").strip()
+    referencia = str(data["referencia"]) if data.get("referencia") else None
+    if len(descripcion) > 255: return None, "descripcion_muy_larga"
+    if not estado or len(estado) > 50: return None, "estado_invalido"
+    if referencia and len(referencia) > 100: return None, "referencia_muy_larga"
+    try: vence = _parse_dia(data.get("vence"))
+    except ValueError: return None, "vence_invalido"
+    return {"monto": monto, "descripcion": descripcion, "estado": estado, "referencia": referencia, "vence": vence}, None
+
+def _leer_lote():
+    """Lista de objetos desde un array JSON ({"items": [...]} también) o NDJSON (una fila por línea)."""
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        out = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip(): continue
+            try: out.append(app.json.loads(line))
+            except ValueError: out.append(None)
+        return out
+    data = request.get_json(silent=True)
+    if isinstance(data, dict): data = data.get("items")
+    return data if isinstance(data, list) else None
+
+def insertar_cobros(filas):
+    """Inserta filas ya validadas por lotes de BULK_CHUNK; devuelve los ids en orden. No hace commit."""
+    ids = []
+    cols = ("monto", "descripcion", "estado", "referencia", "creado_en", "vence", "org_id")
+    if db.engine.dialect.name == "postgresql":
+        # COPY no devuelve ids: se reservan antes desde la secuencia y se copian explícitos
+        conn = db.session.connection().connection.driver_connection
+        with conn.cursor() as cur:
+            for i in range(0, len(filas), BULK_CHUNK):
+                chunk = filas[i:i + BULK_CHUNK]
+                cur.execute("SELECT nextval(pg_get_serial_sequence('cobro', 'id')) FROM generate_series(1, %s)", (len(chunk),))
+                nuevos = [r[0] for r in cur.fetchall()]
+                with cur.copy('COPY "cobro" (id, monto, descripcion, estado, referencia, creado_en, vence, org_id) FROM STDIN') as cp:
+                    for id_, f in zip(nuevos, chunk):
+                        cp.write_row((id_,) + tuple(f[k] for k in cols))
+                ids += nuevos
+    elif db.engine.dialect.name == "sqlite":
+        # RETURNING ordenado hace que SQLAlchemy mande un INSERT por fila en SQLite: un executemany por lote y
+        # los ids salen del rango contiguo que termina en max(id) (la transacción ya tiene el lock de escritura
+        # y cobro.id es INTEGER PRIMARY KEY sin AUTOINCREMENT: cada fila recibe max(rowid) + 1)
+        stmt = Cobro.__table__.insert()
+        for i in range(0, len(filas), BULK_CHUNK):
+            chunk = filas[i:i + BULK_CHUNK]
+            db.session.execute(stmt, [{k: f[k] for k in cols} for f in chunk])
+            ultimo = db.session.execute(text("SELECT max(id) FROM cobro")).scalar()
+            ids += range(ultimo - len(chunk) + 1, ultimo + 1)
+    else:
+        # render_nulls: sin él el bulk del ORM parte el lote por cada combinación de columnas en None
+        stmt = db.insert(Cobro).returning(Cobro.id, sort_by_parameter_order=True)
+        for i in range(0, len(filas), BULK_CHUNK):
+            ids += [r[0] for r in db.session.execute(stmt, filas[i:i + BULK_CHUNK],
+                                                     execution_options={"render_nulls": True})]
+    tocar_version({f["org_id"] for f in filas})
+    return ids
+
+# POST /cobros/bulk  (array JSON o NDJSON; valida todo, inserta las filas válidas en una transacción)
+@app.post("/cobros/bulk")
+def cobros_bulk():
+    u, err = require_auth()
+    if err: return err
+    lote = _leer_lote()
+    if not lote:
+        return jsonify({"error": "faltan_datos"}), 400
+    if len(lote) > BULK_MAX_ROWS:
+        return jsonify({"error": "lote_muy_grande", "max": BULK_MAX_ROWS}), 413
+    ahora = datetime.utcnow()
+    validas, pos, items = [], [], [None] * len(lote)
+    for i, data in enumerate(lote):
+        v, e = _validar_cobro(data)
+        if e:
+            items[i] = {"i": i, "error": e}
+        else:
+            v["creado_en"] = ahora; v["org_id"] = g.org_id
+            validas.append(v); pos.append(i)
+    if not validas:
+        return jsonify({"ok": False, "insertados": 0, "errores": len(lote), "items": items}), 400
+    try:
+        ids = insertar_cobros(validas)
+        deltas = {}
+        for v in validas:
+            key = (g.org_id, ahora.date(), v["estado"])
+            n, t = deltas.get(key, (0, 0.0))
+            deltas[key] = (n + 1, t + v["monto"])
+        rollup_sumar(deltas)
+        planificar_recordatorios(((id_, v["vence"]) for id_, v in zip(ids, validas) if v["vence"]), nuevos=True)
+        db.session.commit()
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": "db_error", "detail": str(e)}), 500
+    for i, id_ in zip(pos, ids):
+        items[i] = {"i": i, "id": id_}
+    return jsonify({
+        "ok": True, "insertados": len(ids), "errores": len(lote) - len(ids), "items": items
+    }), 201
 
 @app.get("/stats")
 def stats():
     u, err = require_auth()
     if err: return err
-    q = Cobro.query
-    desde = request.args.get("desde"); hasta = request.args.get("hasta"); estado = request.args.get("estado")
-    if desde:
-        try: q = q.filter(Cobro.creado_en >= datetime.fromisoformat(desde))
-        except Exception: pass
-    if hasta:
-        try: q = q.filter(Cobro.creado_en <= datetime.fromisoformat(hasta))
-        except Exception: pass
-    if estado: q = q.filter(Cobro.estado == estado)
-    items = q.all()
-    total = sum(float(x.monto or 0.0) for x in items)
-    count = len(items)
-    pagados = sum(1 for x in items if x.estado == "pagado")
-    pendientes = sum(1 for x in items if x.estado == "pendiente")
-    return jsonify({"count": count, "total": total, "pagados": pagados, "pendientes": pendientes}), 200
-
-create_tables_once()
+    etag = _etag_datos()
+    no_mod = _no_modificado(etag)
+    if no_mod: return no_mod
+    # Un solo agregado agrupado por estado: memoria O(estados), no O(filas)
+    if STATS_ROLLUP and _rango_dias_completos():
+        q = _filtrar_rollup(db.session.query(
+            CobroDiario.estado, func.sum(CobroDiario.cantidad), func.sum(CobroDiario.total)
+        )).group_by(CobroDiario.estado)
+    else:
+        q = _filtrar_cobros(db.session.query(
+            Cobro.estado, func.count(Cobro.id), func.coalesce(func.sum(Cobro.monto), 0.0)
+        )).group_by(Cobro.estado)
+    count = 0; total = 0.0; por_estado = {}
+    for est, n, suma in q.all():
+        count += int(n or 0); total += float(suma or 0.0); por_estado[est] = int(n or 0)
+    return _con_etag(jsonify({
+        "count": count, "total": total,
+        "pagados": por_estado.get("pagado", 0), "pendientes": por_estado.get("pendiente", 0)
+    }), etag), 200
+
+def _rango_dias_completos():
+    # El rollup solo responde exacto si desde es 00:00 y hasta cubre el día entero (o faltan)
+    desde = _parse_fecha(request.args.get("desde")); hasta = _parse_fecha(request.args.get("hasta"))
+    if request.args.get("desde") and (not desde or desde.time() != dtime.min): return False
+    if request.args.get("hasta") and (not hasta or hasta.time() < dtime(23, 59, 59)): return False
+    return True
+
+def _filtrar_rollup(q):
+    q = q.filter(CobroDiario.org_id == (g.get("org_id") or ""))
+    estado = request.args.get("estado")
+    if estado: q = q.filter(CobroDiario.estado == estado)
+    desde = _parse_fecha(request.args.get("desde")); hasta = _parse_fecha(request.args.get("hasta"))
+    if desde: q = q.filter(CobroDiario.dia >= desde.date())
+    if hasta: q = q.filter(CobroDiario.dia <= hasta.date())
+    return q
+
+def _bucket(dia, granularity):
+    if granularity == "week": return dia - timedelta(days=dia.weekday())
+    if granularity == "month": return dia.replace(day=1)
+    return dia
+
+# GET /stats/series?granularity=day|week|month (&desde, &hasta, &estado; resolución de día)
+@app.get("/stats/series")
+def stats_series():
+    u, err = require_auth()
+    if err: return err
+    granularity = request.args.get("granularity", "day")
+    if granularity not in ("day", "week", "month"):
+        return jsonify({"error": "granularity_invalida"}), 400
+    if STATS_ROLLUP:
+        q = _filtrar_rollup(db.session.query(
+            CobroDiario.dia, CobroDiario.estado, CobroDiario.cantidad, CobroDiario.total
+        ))
+    else:
+        # sin STATS_ROLLUP el rollup puede no estar completo: mismo agregado por día desde cobro
+        dia = func.date(Cobro.creado_en)
+        q = _filtrar_cobros(db.session.query(
+            dia, Cobro.estado, func.count(Cobro.id), func.coalesce(func.sum(Cobro.monto), 0.0)
+        )).group_by(dia, Cobro.estado)
+    buckets = {}
+    for dia, est, n, suma in q.all():
+        if isinstance(dia, str): dia = date.fromisoformat(dia)  # SQLite: date() devuelve texto
+        b = buckets.setdefault(_bucket(dia, granularity), {"count": 0, "total": 0.0, "pagados": 0, "pendientes": 0})
+        b["count"] += n; b["total"] += float(suma or 0.0)
+        if est == "pagado": b["pagados"] += n
+        elif est == "pendiente": b["pendientes"] += n
+    items = [dict(bucket=k.isoformat(), **v) for k, v in sorted(buckets.items())]
+    return jsonify({"granularity": granularity, "items": items}), 200
+
+if SCHEMA_ON_START:
+    setup_schema()
+
 # POST|PATCH /cobros/<id>/cobrar  (requiere token)
 @app.route("/cobros/<int:cobro_id>/cobrar", methods=["POST","PATCH"])
 def cobros_cobrar(cobro_id: int):
     u, err = require_auth()
     if err: return err
-    c = Cobro.query.get(cobro_id)
-    if not c:
+    # FOR UPDATE: dos requests (o un reintento) sobre el mismo cobro no descuentan dos veces del rollup
+    c = db.session.get(Cobro, cobro_id, with_for_update=True, populate_existing=True)
+    if not c or c.org_id != g.org_id:
+        db.session.rollback()
+        return jsonify({"error": "no_encontrado"}), 404
+    if c.estado != "pagado":
+        org, dia, monto = c.org_id, c.creado_en.date(), float(c.monto or 0.0)
+        rollup_sumar({(org, dia, c.estado): (-1, -monto), (org, dia, "pagado"): (1, monto)})
+        tocar_version([org])
+        c.estado = "pagado"
+    out = _cobro_dict(c)
+    db.session.commit()
+    return jsonify(out), 200
+
+# claves aceptadas en {"filtro": {...}} de /cobros/cobrar
+FILTRO_BULK = frozenset(("estado", "desde", "hasta"))
+
+# POST /cobros/cobrar  {"ids": [...]} o {"filtro": {"estado", "desde", "hasta"}}
+# Marca como pagado en un UPDATE ... RETURNING por lote; reintentar es seguro (los ya pagados no cambian)
+@app.post("/cobros/cobrar")
+def cobros_cobrar_bulk():
+    u, err = require_auth()
+    if err: return err
+    data = request.get_json(silent=True) or {}
+    ids, filtro = data.get("ids"), data.get("filtro")
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            return jsonify({"error": "ids_invalidos"}), 400
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > BULK_MAX_ROWS:
+            return jsonify({"error": "lote_muy_grande", "max": BULK_MAX_ROWS}), 413
+        previos = []
+        for i in range(0, len(ids), BULK_CHUNK):
+            previos += _de_org(db.session.query(Cobro.id, Cobro.estado)).filter(Cobro.id.in_(ids[i:i + BULK_CHUNK])) \
+                .with_for_update().all()
+    elif isinstance(filtro, dict) and filtro:
+        # filtro estricto: una clave desconocida o una fecha ilegible no pueden ampliar el lote a "todo lo pendiente"
+        extra = sorted(set(filtro) - FILTRO_BULK)
+        if extra:
+            return jsonify({"error": "filtro_invalido", "claves": extra}), 400
+        for k in ("desde", "hasta"):
+            v = filtro.get(k)
+            if v not in (None, "") and (not isinstance(v, str) or _parse_fecha(v) is None):
+                return jsonify({"error": "fecha_invalida", "campo": k}), 400
+        if filtro.get("estado") is not None and not isinstance(filtro["estado"], str):
+            return jsonify({"error": "filtro_invalido", "claves": ["estado"]}), 400
+        if not any(filtro.get(k) for k in FILTRO_BULK):
+            return jsonify({"error": "filtro_vacio"}), 400
+        q = _filtrar_cobros(db.session.query(Cobro.id, Cobro.estado), filtro)
+        previos = q.filter(Cobro.estado != "pagado").limit(BULK_MAX_ROWS + 1).with_for_update().all()
+        if len(previos) > BULK_MAX_ROWS:
+            db.session.rollback()
+            return jsonify({"error": "lote_muy_grande", "max": BULK_MAX_ROWS}), 413
+        ids = [i for i, _ in previos]
+    else:
+        return jsonify({"error": "faltan_datos"}), 400
+
+    estado_previo = dict(previos)
+    objetivo = [i for i, est in previos if est != "pagado"]
+    cambiados, deltas = [], {}
+    try:
+        for i in range(0, len(objetivo), BULK_CHUNK):
+            stmt = db.update(Cobro).where(Cobro.id.in_(objetivo[i:i + BULK_CHUNK]), Cobro.estado != "pagado") \
+                .values(estado="pagado").returning(*COBRO_COLS)
+            cambiados += db.session.execute(stmt, execution_options={"synchronize_session": False}).all()
+        for x in cambiados:
+            dia, monto = x.creado_en.date(), float(x.monto or 0.0)
+            for key, n, t in (((x.org_id, dia, estado_previo[x.id]), -1, -monto), ((x.org_id, dia, "pagado"), 1, monto)):
+                n0, t0 = deltas.get(key, (0, 0.0))
+                deltas[key] = (n0 + n, t0 + t)
+        rollup_sumar(deltas)
+        tocar_version({x.org_id for x in cambiados})
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": "db_error", "detail": str(e)}), 500
+    hechos = {x.id for x in cambiados}
+    return jsonify({
+        "ok": True,
+        "pagados": [_cobro_dict(x) for x in cambiados],
+        "ya_pagados": [i for i in ids if i in estado_previo and i not in hechos],
+        "no_encontrados": [i for i in ids if i not in estado_previo],
+    }), 200
+
+# PUT|PATCH /cobros/<id>/vence  {"vence": "YYYY-MM-DD" | null}  (replanifica sus recordatorios)
+@app.route("/cobros/<int:cobro_id>/vence", methods=["PUT", "PATCH"])
+def cobros_vence(cobro_id: int):
+    u, err = require_auth()
+    if err: return err
+    data = request.get_json(silent=True) or {}
+    try: vence = _parse_dia(data.get("vence"))
+    except ValueError: return jsonify({"error": "vence_invalido"}), 400
+    c = db.session.get(Cobro, cobro_id)
+    if not c or c.org_id != g.org_id:
         return jsonify({"error": "no_encontrado"}), 404
-    c.estado = "pagado"
+    if c.vence != vence:
+        c.vence = vence
+        planificar_recordatorios([(c.id, vence)])
+        tocar_version([c.org_id])
+    out = _cobro_dict(c)
     db.session.commit()
+    return jsonify(out), 200
+
+# ---- Recordatorios (los consume worker.py; header X-Admin-Secret) ----
+@app.get("/recordatorios/plan")
+def recordatorios_plan():
+    if request.headers.get("X-Admin-Secret") != ADMIN_SECRET:
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    p = db.session.get(RecordatorioPlan, 1)
     return jsonify({
-        "id": c.id, "monto": float(c.monto or 0.0), "descripcion": c.descripcion,
-        "estado": c.estado, "referencia": c.referencia, "creado_en": c.creado_en.isoformat()
+        "waves": [int(x) for x in p.waves.split(",") if x] if p else WAVE_DAYS,
+        "en_curso": [int(x) for x in p.replan_waves.split(",") if x] if p and p.replan_waves else None,
+        "actualizado_en": p.actualizado_en.isoformat() if p else None,
     }), 200
 
-# GET /cobros/export (CSV, requiere token)
+# POST /recordatorios/replan  {"waves": [15, 7, 0]}
+# Replanifica un tramo de REPLAN_CHUNK cobros por llamada: 202 mientras falten (volver a llamar), 200 al terminar
+@app.post("/recordatorios/replan")
+def recordatorios_replan():
+    if request.headers.get("X-Admin-Secret") != ADMIN_SECRET:
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    waves = (request.get_json(silent=True) or {}).get("waves")
+    if not isinstance(waves, list) or not all(isinstance(w, int) and w >= 0 for w in waves):
+        return jsonify({"error": "waves_invalidas"}), 400
+    try:
+        n, completo = replan_recordatorios(sorted(set(waves), reverse=True))
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": "db_error", "detail": str(e)}), 500
+    p = db.session.get(RecordatorioPlan, 1)
+    return jsonify({"ok": True, "completo": completo, "waves": _plan_waves(), "planificados": n,
+                    "cursor": p.replan_cursor}), 200 if completo else 202
+
+# GET /recordatorios/pendientes  -> vencidos (send_at <= hoy), no entregados, de cobros no pagados
+# (los fallidos vuelven hasta ENTREGA_MAX_INTENTOS; los descartados no)
+@app.get("/recordatorios/pendientes")
+def recordatorios_pendientes():
+    if request.headers.get("X-Admin-Secret") != ADMIN_SECRET:
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    limit = min(_int_arg("limit", BULK_MAX_ROWS) or BULK_MAX_ROWS, BULK_MAX_ROWS)
+    q = db.session.query(Recordatorio.id, Recordatorio.cobro_id, Recordatorio.wave, Recordatorio.send_at,
+                         func.coalesce(Entrega.intentos, 0)) \
+        .join(Cobro, Cobro.id == Recordatorio.cobro_id) \
+        .outerjoin(Entrega, Entrega.recordatorio_id == Recordatorio.id) \
+        .filter(Recordatorio.send_at <= _hoy(), Recordatorio.enviado_en.is_(None), Cobro.estado != "pagado",
+                db.or_(Entrega.id.is_(None), db.and_(Entrega.intentos < ENTREGA_MAX_INTENTOS,
+                                                     Entrega.estado != "descartado"))) \
+        .order_by(Recordatorio.send_at, Recordatorio.id).limit(limit)
+    return jsonify([{"id": i, "cobro_id": c, "wave": w, "send_at": d.isoformat(), "intentos": n}
+                    for i, c, w, d, n in q.all()]), 200
+
+# POST /recordatorios/entregas  {"resultados": [{"id": <recordatorio>, "ok": bool, "resp": ..., "reintentar": bool}]}
+# Un commit por llamada; el worker reporta por lotes después de cada tanda enviada.
+# Un fallo con "reintentar": false (p.ej. 5xx o timeout: pudo haberse enviado) queda "descartado" y no vuelve.
+@app.post("/recordatorios/entregas")
+def recordatorios_entregas():
+    if request.headers.get("X-Admin-Secret") != ADMIN_SECRET:
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    res = (request.get_json(silent=True) or {}).get("resultados")
+    if not isinstance(res, list) or not all(isinstance(r, dict) and isinstance(r.get("id"), int) for r in res):
+        return jsonify({"error": "resultados_invalidos"}), 400
+    ahora = datetime.utcnow()
+    rows = [{
+        "recordatorio_id": r["id"], "intentos": 1, "estado": "enviado" if r.get("ok") else "fallido" if r.get("reintentar", True) else "descartado",
+        "respuesta": (r["resp"] if isinstance(r.get("resp"), str) else json.dumps(r.get("resp"), ensure_ascii=False))[:1000],
+        "creado_en": ahora, "actualizado_en": ahora,
+    } for r in res]
+    enviados = [r["id"] for r in res if r.get("ok")]
+    try:
+        if rows:
+            stmt = _upsert(Entrega)
+            stmt = stmt.on_conflict_do_update(index_elements=[Entrega.recordatorio_id], set_={
+                "intentos": Entrega.intentos + 1, "estado": stmt.excluded.estado,
+                "respuesta": stmt.excluded.respuesta, "actualizado_en": stmt.excluded.actualizado_en,
+            })
+            for i in range(0, len(rows), BULK_CHUNK):
+                db.session.execute(stmt, rows[i:i + BULK_CHUNK])
+        for i in range(0, len(enviados), BULK_CHUNK):
+            db.session.query(Recordatorio).filter(Recordatorio.id.in_(enviados[i:i + BULK_CHUNK]),
+                                                  Recordatorio.enviado_en.is_(None)) \
+                .update({"enviado_en": ahora}, synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": "db_error", "detail": str(e)}), 500
+    return jsonify({"ok": True, "registrados": len(rows), "enviados": len(enviados)}), 200
+
+# GET /cobros/export (CSV en streaming, requiere token; mismos filtros que /cobros, ?gzip=1 comprime al vuelo)
 @app.get("/cobros/export")
 def cobros_export():
     u, err = require_auth()
     if err: return err
-    import io, csv
+    import io, csv, zlib
     cols = ["id","descripcion","monto","estado","referencia","creado_en"]
-    buf = io.StringIO()
-    w = csv.writer(buf)
-    w.writerow(cols)
-    for x in Cobro.query.order_by(Cobro.id.desc()).all():
-        w.writerow([x.id, x.descripcion, float(x.monto or 0.0), x.estado, x.referencia or "", x.creado_en.isoformat()])
+    q = _filtrar_cobros(db.session.query(Cobro.id, Cobro.descripcion, Cobro.monto, Cobro.estado,
+                                         Cobro.referencia, Cobro.creado_en)).order_by(Cobro.id.desc())
+    gz = request.args.get("gzip") in ("1", "true")
+
+    def filas():
+        buf = io.StringIO()
+        w = csv.writer(buf)
+        w.writerow(cols)
+        for i, x in enumerate(q.yield_per(STREAM_BATCH), 1):
+            w.writerow([x.id, x.descripcion, float(x.monto or 0.0), x.estado, x.referencia or "", x.creado_en.isoformat()])
+            if i % STREAM_BATCH == 0:
+                yield buf.getvalue().encode("utf-8")
+                buf.seek(0); buf.truncate()
+        yield buf.getvalue().encode("utf-8")
+
+    def comprimido():
+        z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> formato gzip
+        for chunk in filas():
+            out = z.compress(chunk)
+            if out: yield out
+        yield z.flush()
+
     return Response(
-        buf.getvalue(),
+        stream_with_context(comprimido() if gz else filas()),
         status=200,
         headers={
-            "Content-Type": "text/csv; charset=utf-8",
-            "Content-Disposition": "attachment; filename=export_cobros.csv"
+            "Content-Type": "application/gzip" if gz else "text/csv; charset=utf-8",
+            "Content-Disposition": f"attachment; filename=export_cobros.csv{'.gz' if gz else ''}"
         }
     )
-
@@ -1,8 +1,9 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from datetime import timedelta
 from app import db
+import importlib
 import os
 
 bp = Blueprint("auth", __name__, url_prefix="/auth")
@@ -46,15 +47,12 @@ def _pick_attr(obj, candidates):
             return name
     return None
 
-def _get_user_model_and_fields():
-    _load_models()
-
+def _autodetect(classes):
     best = None
     best_score = -1
     best_fields = {}
 
-    for cls in _iter_model_classes():
-        attrs = _attrs(cls)
+    for cls in classes:
         u = _pick_attr(cls, USER_FIELD_CANDIDATES)
         p = _pick_attr(cls, PASS_FIELD_CANDIDATES)
         r = _pick_attr(cls, ROLE_FIELD_CANDIDATES)
@@ -64,11 +62,58 @@ def _get_user_model_and_fields():
             best_score = score
             best_fields = {"user": u, "pass": p, "role": r}
 
-    if not best:
-        return None, None
-
     return best, best_fields
 
+def _resolve_user_model(config=None):
+    """Modelo + campos de usuario. Override explícito con config/env:
+    AUTH_USER_MODEL="models.User" y AUTH_USER_FIELDS="username,password_hash[,role]"."""
+    config = config or {}
+    spec = config.get("AUTH_USER_MODEL") or os.getenv("AUTH_USER_MODEL")
+    if not spec:
+        _load_models()
+        cls, fields = _autodetect(_iter_model_classes())
+        return (cls, fields, "autodetect") if cls else (None, None, None)
+
+    mod, _, name = spec.replace(":", ".").rpartition(".")
+    cls = getattr(importlib.import_module(mod), name)
+    raw = config.get("AUTH_USER_FIELDS") or os.getenv("AUTH_USER_FIELDS")
+    if isinstance(raw, str):
+        parts = [x.strip() for x in raw.split(",") if x.strip()] + [None, None, None]
+        fields = {"user": parts[0], "pass": parts[1], "role": parts[2]}
+    elif raw:
+        fields = {"user": raw.get("user"), "pass": raw.get("pass"), "role": raw.get("role")}
+    if raw and not (fields["user"] and fields["pass"]):
+        raise RuntimeError(f"AUTH_USER_MODEL={spec}: AUTH_USER_FIELDS={raw!r} necesita usuario y password "
+                           "(\"username,password_hash[,role]\")")
+    if not raw:
+        _, fields = _autodetect([cls])
+        if not fields:
+            raise RuntimeError(f"AUTH_USER_MODEL={spec}: no encontré campos usuario/password; definí AUTH_USER_FIELDS")
+    return cls, fields, "config"
+
+# se resuelve una sola vez al registrar el blueprint (o en el primer uso si entonces falló)
+_RESOLVED = None
+
+@bp.record_once
+def _on_register(state):
+    global _RESOLVED
+    try:
+        cls, fields, source = _resolve_user_model(state.app.config)
+    except Exception as e:
+        state.app.logger.error(f"auth: no pude resolver AUTH_USER_MODEL: {e}")
+        return
+    if cls:
+        _RESOLVED = (cls, fields, source)
+
+def _get_user_model_and_fields():
+    global _RESOLVED
+    if _RESOLVED is None:
+        cls, fields, source = _resolve_user_model(current_app.config)
+        if not cls:
+            return None, None
+        _RESOLVED = (cls, fields, source)
+    return _RESOLVED[0], _RESOLVED[1]
+
 def _hash_password(raw: str):
     return generate_password_hash(raw)
 
@@ -90,7 +135,11 @@ def _diagnose():
             "class": cls.__name__,
             "attrs": sorted([a for a in _attrs(cls) if not a.startswith("_")])[:80]
         })
-    return jsonify({"models": out})
+    resolved = None
+    if _RESOLVED:
+        cls, fields, source = _RESOLVED
+        resolved = {"class": f"{cls.__module__}.{cls.__name__}", "fields": fields, "source": source}
+    return jsonify({"models": out, "resolved": resolved})
 
 # ---------------- rutas ----------------
 @bp.post("/bootstrap-admin")
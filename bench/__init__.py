@@ -0,0 +1 @@
+# bench — benchmarks reproducibles de la API (ver README)
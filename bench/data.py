@@ -0,0 +1,103 @@
+"""Datos sintéticos para benchmarks: usuarios, orgs y cobros por inserción masiva.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench.data --cobros 100000 --users 8 --orgs 4
+    DATABASE_URL=postgresql://localhost/noa_bench python -m bench.data --cobros 10000000 --users 50 --orgs 10
+
+Usuarios bench<i>@noa.local / bench-pass, cada uno miembro de la org i % orgs (con --orgs 0 los cobros
+quedan sin org). Los cobros se insertan con app.insertar_cobros (COPY en PostgreSQL) en lotes de
+--chunk con un commit por lote y al final se reconstruye el rollup. Misma --seed, mismos datos (fechas
+incluidas: creado_en se cuenta hacia atrás desde fecha_base(seed), no desde el reloj).
+Imprime JSON con volúmenes y filas/s.
+"""
+import argparse, json, random, sys, time, uuid
+from datetime import datetime, timedelta
+
+PASSWORD = "bench-pass"
+ESTADOS = (("pendiente", 0.7), ("pagado", 0.3))
+
+def email(i):
+    return f"bench{i}@noa.local"
+
+def org_id(i):
+    return str(uuid.UUID(int=i + 1))
+
+def fecha_base(seed):
+    # "ahora" de los datos sintéticos: fijo por seed para que dos corridas generen las mismas filas
+    return datetime(2025, 1, 1) + timedelta(days=seed % 365)
+
+def _usuarios(A, n, base):
+    pw = A.passwords.hash_password(PASSWORD)  # un solo bcrypt para todos
+    existentes = {e for (e,) in A.db.session.query(A.User.email).filter(A.User.email.in_([email(i) for i in range(n)]))}
+    nuevos = [{"email": email(i), "password_hash": pw, "creado_en": base}
+              for i in range(n) if email(i) not in existentes]
+    if nuevos: A.db.session.execute(A.db.insert(A.User), nuevos)
+    A.db.session.commit()
+    return [uid for (uid,) in A.db.session.query(A.User.id).filter(A.User.email.in_([email(i) for i in range(n)]))
+            .order_by(A.User.id)]
+
+def _orgs(A, user_ids, n):
+    # membresías en user_org (las que lee require_auth), usuario i -> org i % n
+    if not n: return []
+    orgs = [org_id(i) for i in range(n)]
+    ya = {(u, o) for u, o in A.db.session.query(A.UserOrg.user_id, A.UserOrg.org_id)
+          .filter(A.UserOrg.user_id.in_(user_ids))}
+    filas = [{"user_id": uid, "org_id": orgs[i % n]} for i, uid in enumerate(user_ids) if (uid, orgs[i % n]) not in ya]
+    if filas: A.db.session.execute(A.db.insert(A.UserOrg), filas)
+    A.db.session.commit()
+    return orgs
+
+def _cobros(A, total, orgs, days, chunk, rng, base):
+    ahora = base
+    estados = [e for e, _ in ESTADOS]; pesos = [p for _, p in ESTADOS]
+    hechos = 0
+    while hechos < total:
+        n = min(chunk, total - hechos)
+        filas = []
+        for _ in range(n):
+            creado = ahora - timedelta(seconds=rng.randrange(days * 86400))
+            filas.append({
+                "monto": round(rng.uniform(1000, 250000), 2),
+                "descripcion": f"Cobro {rng.choice(('mensualidad', 'servicio', 'cuota', 'factura'))} #{rng.randrange(10**6)}",
+                "estado": rng.choices(estados, pesos)[0],
+                "referencia": f"REF-{rng.randrange(10**9):09d}",
+                "creado_en": creado,
+                "vence": (creado + timedelta(days=30)).date() if rng.random() < 0.5 else None,
+                "org_id": orgs[rng.randrange(len(orgs))] if orgs else None,
+            })
+        A.insertar_cobros(filas)
+        A.db.session.commit()
+        hechos += n
+        print(f"[bench.data] {hechos}/{total}", file=sys.stderr)
+    return hechos
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--cobros", type=int, default=10000)
+    ap.add_argument("--users", type=int, default=4)
+    ap.add_argument("--orgs", type=int, default=2)
+    ap.add_argument("--days", type=int, default=365, help="creado_en repartido en los N días previos a fecha_base(seed)")
+    ap.add_argument("--chunk", type=int, default=50000, help="filas por lote (un commit por lote)")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    import app as A
+    rng = random.Random(args.seed)
+    t0 = time.perf_counter()
+    with A.app.app_context():
+        A.setup_schema()
+        base = fecha_base(args.seed)
+        user_ids = _usuarios(A, args.users, base)
+        orgs = _orgs(A, user_ids, args.orgs)
+        t1 = time.perf_counter()
+        n = _cobros(A, args.cobros, orgs, args.days, args.chunk, rng, base)
+        t2 = time.perf_counter()
+        A.rollup_rebuild()
+        t3 = time.perf_counter()
+        print(json.dumps({
+            "db": A.db.engine.dialect.name, "cobros": n, "users": len(user_ids), "orgs": len(orgs),
+            "seed": args.seed, "insert_s": round(t2 - t1, 2), "filas_por_s": round(n / max(t2 - t1, 1e-9)),
+            "rollup_s": round(t3 - t2, 2), "total_s": round(t3 - t0, 2),
+        }))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Carga mixta contra la API: latencias p50/p95/p99, throughput y RSS máximo en JSON.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench.data --cobros 100000
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench.load --concurrency 8 --seconds 30 \\
+        --mix login=1,cobros=6,stats=2,export=1,cobrar=1 --out resultados.json
+
+Por defecto usa el test client de Flask en este proceso (app + carga en el mismo RSS); con --url
+apunta a un servidor ya levantado (p. ej. gunicorn) y el RSS reportado es solo el del driver.
+Los usuarios son los de bench.data (--users debe coincidir o ser menor). Misma --seed, misma secuencia.
+"""
+import argparse, json, os, random, resource, subprocess, sys, threading, time
+from datetime import datetime, timedelta
+
+from bench.data import email, fecha_base, PASSWORD
+
+MIX_DEFAULT = "login=1,cobros=6,stats=2,export=1,cobrar=1"
+
+def _pct(xs, p):
+    if not xs: return None
+    return round(xs[min(len(xs) - 1, int(len(xs) * p))] * 1000, 2)
+
+def _rss_max_mb():
+    # ru_maxrss viene en KB en Linux y en bytes en macOS
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(r / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip() or None
+    except OSError:
+        return None
+
+class _Cliente:
+    """Misma interfaz para el test client y para un servidor HTTP real: (status, cuerpo)."""
+    def __init__(self, url=None):
+        self.url = url.rstrip("/") if url else None
+        if self.url:
+            import requests
+            self.s = requests.Session()
+        else:
+            import app as A
+            self.c = A.app.test_client()
+
+    def req(self, method, path, headers=None, json_=None):
+        if self.url:
+            r = self.s.request(method, self.url + path, headers=headers, json=json_, timeout=120)
+            return r.status_code, r.content
+        r = self.c.open(path, method=method, headers=headers, json=json_)
+        return r.status_code, r.get_data()
+
+def _parse_mix(raw):
+    mix = {}
+    for parte in raw.split(","):
+        k, _, v = parte.partition("=")
+        if k.strip(): mix[k.strip()] = float(v or 1)
+    desconocidas = set(mix) - {"login", "cobros", "stats", "export", "cobrar"}
+    if desconocidas: raise SystemExit(f"mix desconocido: {sorted(desconocidas)}")
+    return mix
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--url", help="servidor ya levantado; sin esto se usa el test client en proceso")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--seconds", type=float, default=20)
+    ap.add_argument("--mix", default=MIX_DEFAULT, help="endpoint=peso separados por coma")
+    ap.add_argument("--users", type=int, default=4)
+    ap.add_argument("--page", type=int, default=50, help="limit de GET /cobros")
+    ap.add_argument("--export-days", type=int, default=7, help="ventana de /cobros/export (los últimos N días de bench.data)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", help="además de stdout, escribe el JSON aquí")
+    args = ap.parse_args()
+    mix = _parse_mix(args.mix)
+
+    if not args.url:
+        import app as A
+        A.setup_schema()
+    cli = _Cliente(args.url)
+
+    # tokens y muestra de cobros pendientes por usuario (su org)
+    sesiones = []
+    for i in range(args.users):
+        st, body = cli.req("POST", "/auth/login", json_={"email": email(i), "password": PASSWORD})
+        if st != 200: raise SystemExit(f"login de {email(i)} falló ({st}): ¿corriste bench.data?")
+        h = {"Authorization": f"Bearer {json.loads(body)['access_token']}"}
+        st, body = cli.req("GET", "/cobros?estado=pendiente&limit=1000", headers=h)
+        ids = [x["id"] for x in json.loads(body)] if st == 200 else []
+        sesiones.append({"i": i, "h": h, "ids": ids})
+
+    desde = (fecha_base(args.seed) - timedelta(days=args.export_days)).isoformat()  # misma --seed que bench.data
+    ops = {
+        "login": lambda s, rng: ("POST", "/auth/login", None, {"email": email(s["i"]), "password": PASSWORD}),
+        "cobros": lambda s, rng: ("GET", f"/cobros?limit={args.page}", s["h"], None),
+        "stats": lambda s, rng: ("GET", "/stats", s["h"], None),
+        "export": lambda s, rng: ("GET", f"/cobros/export?desde={desde}", s["h"], None),
+        "cobrar": lambda s, rng: ("POST", f"/cobros/{rng.choice(s['ids'])}/cobrar" if s["ids"] else "/cobros/0/cobrar",
+                                  s["h"], None),
+    }
+    nombres = list(mix); pesos = [mix[n] for n in nombres]
+    lat = {n: [] for n in nombres}; errores = {n: 0 for n in nombres}; bytes_ = {n: 0 for n in nombres}
+    lock = threading.Lock()
+    fin = time.monotonic() + args.seconds
+
+    def loop(k):
+        rng = random.Random(args.seed + k)
+        c = _Cliente(args.url)
+        while time.monotonic() < fin:
+            op = rng.choices(nombres, pesos)[0]
+            method, path, h, body = ops[op](sesiones[rng.randrange(len(sesiones))], rng)
+            t = time.perf_counter()
+            try:
+                st, cuerpo = c.req(method, path, headers=h, json_=body)
+                n = len(cuerpo)
+            except Exception:
+                st, n = 0, 0
+            dur = time.perf_counter() - t
+            with lock:
+                if 200 <= st < 300:
+                    lat[op].append(dur); bytes_[op] += n
+                else:
+                    errores[op] += 1
+
+    ts = [threading.Thread(target=loop, args=(k,)) for k in range(args.concurrency)]
+    t0 = time.monotonic()
+    for t in ts: t.start()
+    for t in ts: t.join()
+    dur = time.monotonic() - t0
+
+    por_op = {}
+    for n in nombres:
+        xs = sorted(lat[n])
+        por_op[n] = {"ok": len(xs), "errores": errores[n], "rps": round(len(xs) / dur, 2),
+                     "p50_ms": _pct(xs, 0.5), "p95_ms": _pct(xs, 0.95), "p99_ms": _pct(xs, 0.99),
+                     "bytes": bytes_[n]}
+    todas = sorted(x for xs in lat.values() for x in xs)
+    out = {
+        "fecha": datetime.utcnow().isoformat(timespec="seconds") + "Z", "commit": _commit(),
+        "target": args.url or "in-process", "python": sys.version.split()[0], "cpus": os.cpu_count(),
+        "concurrency": args.concurrency, "seconds": round(dur, 2), "mix": mix, "seed": args.seed,
+        "total": {"ok": len(todas), "errores": sum(errores.values()), "rps": round(len(todas) / dur, 2),
+                  "p50_ms": _pct(todas, 0.5), "p95_ms": _pct(todas, 0.95), "p99_ms": _pct(todas, 0.99)},
+        "endpoints": por_op, "rss_max_mb": _rss_max_mb(),
+    }
+    txt = json.dumps(out, indent=2)
+    print(txt)
+    if args.out:
+        with open(args.out, "w") as f: f.write(txt + "\n")
+
+if __name__ == "__main__":
+    main()
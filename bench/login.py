@@ -0,0 +1,76 @@
+"""Throughput de /auth/login con bcrypt en el thread de request vs en el pool de procesos.
+
+    python -m bench.login --concurrency 8 --seconds 10
+
+Cada modo corre en un subproceso (passwords.py lee su config al importar) contra una
+base SQLite temporal y el test client de Flask. Mientras N threads hacen login, otro
+thread consulta GET /cobros para medir cuánto lo frenan. Imprime JSON.
+"""
+import argparse, json, os, subprocess, sys, tempfile, threading, time
+
+MODOS = {"inline": {"PASSWORD_WORKERS": "0"}, "pool": {}}
+
+def _pct(xs, p):
+    if not xs: return None
+    xs = sorted(xs)
+    return round(xs[min(len(xs) - 1, int(len(xs) * p))] * 1000, 2)
+
+def _correr(concurrency, seconds):
+    import app as A
+    A.setup_schema()
+    c = A.app.test_client()
+    cred = {"email": "bench@noa.local", "password": "bench-pass"}
+    c.post("/auth/register", json=cred)
+    tok = c.post("/auth/login", json=cred).get_json()["access_token"]
+    fin = time.monotonic() + seconds
+    logins, busy, cobros_lat = [], [0], []
+
+    def login_loop():
+        cl = A.app.test_client()
+        while time.monotonic() < fin:
+            t = time.perf_counter()
+            r = cl.post("/auth/login", json=cred)
+            if r.status_code == 200: logins.append(time.perf_counter() - t)
+            elif r.status_code == 503: busy[0] += 1
+
+    def cobros_loop():
+        cl = A.app.test_client()
+        h = {"Authorization": f"Bearer {tok}"}
+        while time.monotonic() < fin:
+            t = time.perf_counter()
+            cl.get("/cobros?limit=20", headers=h)
+            cobros_lat.append(time.perf_counter() - t)
+            time.sleep(0.01)
+
+    ts = [threading.Thread(target=login_loop) for _ in range(concurrency)] + [threading.Thread(target=cobros_loop)]
+    t0 = time.monotonic()
+    for t in ts: t.start()
+    for t in ts: t.join()
+    dur = time.monotonic() - t0
+    return {
+        "logins": len(logins), "logins_per_s": round(len(logins) / dur, 2), "busy_503": busy[0],
+        "login_p50_ms": _pct(logins, 0.5), "login_p95_ms": _pct(logins, 0.95),
+        "cobros_p50_ms": _pct(cobros_lat, 0.5), "cobros_p95_ms": _pct(cobros_lat, 0.95),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--mode", choices=sorted(MODOS))
+    args = ap.parse_args()
+    if args.mode:
+        print(json.dumps(_correr(args.concurrency, args.seconds)))
+        return
+    out = {"concurrency": args.concurrency, "seconds": args.seconds, "cpus": os.cpu_count()}
+    for modo, env in MODOS.items():
+        with tempfile.TemporaryDirectory() as d:
+            e = dict(os.environ, DATABASE_URL=f"sqlite:///{d}/bench.db", **env)
+            r = subprocess.run([sys.executable, "-m", "bench.login", "--mode", modo,
+                                "--concurrency", str(args.concurrency), "--seconds", str(args.seconds)],
+                               env=e, capture_output=True, text=True, check=True)
+            out[modo] = json.loads(r.stdout.strip().splitlines()[-1])
+    print(json.dumps(out, indent=2))
+
+if __name__ == "__main__":
+    main()
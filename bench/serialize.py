@@ -0,0 +1,74 @@
+"""CPU por fila de la lista de cobros: objetos ORM + json de stdlib vs tuplas proyectadas + app.json.
+
+    python -m bench.serialize --rows 20000 --repeat 5
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench.serialize --rows 50000   # datos de bench.data
+
+Sin DATABASE_URL usa una base SQLite temporal con --rows cobros sintéticos. Mide tiempo de CPU del
+proceso (query + armado de dicts + JSON) con el mejor de --repeat corridas. "antes" reproduce el camino
+anterior (Cobro ORM, isoformat() por fila, json.dumps con sort_keys); "ahora" es el de cobros_list.
+Imprime JSON con µs/fila de cada camino y la razón.
+"""
+import argparse, json, os, random, sys, tempfile, time
+from datetime import datetime, timedelta
+
+def _antes(A, n):
+    filas = A.Cobro.query.order_by(A.Cobro.id.desc()).limit(n).all()
+    return json.dumps([{
+        "id": x.id, "monto": float(x.monto or 0.0), "descripcion": x.descripcion,
+        "estado": x.estado, "referencia": x.referencia, "creado_en": x.creado_en.isoformat(),
+        "vence": x.vence.isoformat() if x.vence else None, "org_id": x.org_id
+    } for x in filas], sort_keys=True)
+
+def _ahora(A, n):
+    filas = A.db.session.query(*A.COBRO_COLS).order_by(A.Cobro.id.desc()).limit(n).all()
+    return A.app.json.dumps([A._cobro_dict(x) for x in filas])
+
+def _medir(A, fn, n, repeat):
+    mejor = None
+    for _ in range(repeat):
+        A.db.session.expunge_all()  # sin identity map de la corrida anterior
+        t = time.process_time()
+        out = fn(A, n)
+        dt = time.process_time() - t
+        mejor = dt if mejor is None else min(mejor, dt)
+    return mejor, out
+
+def _sembrar(A, n):
+    rng = random.Random(42)
+    ahora = datetime.utcnow()
+    A.insertar_cobros([{
+        "monto": round(rng.uniform(1000, 250000), 2), "descripcion": f"Cobro cuota #{rng.randrange(10**6)}",
+        "estado": rng.choice(("pendiente", "pagado")), "referencia": f"REF-{rng.randrange(10**9):09d}",
+        "creado_en": ahora - timedelta(seconds=rng.randrange(86400 * 90)),
+        "vence": ahora.date() if rng.random() < 0.5 else None, "org_id": None,
+    } for _ in range(n)])
+    A.db.session.commit()
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=20000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    tmp = None
+    if not os.getenv("DATABASE_URL"):
+        tmp = tempfile.TemporaryDirectory()
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/bench.db"
+    import app as A
+    with A.app.app_context():
+        A.setup_schema()
+        if tmp: _sembrar(A, args.rows)
+        antes, a = _medir(A, _antes, args.rows, args.repeat)
+        ahora, b = _medir(A, _ahora, args.rows, args.repeat)
+        n = len(json.loads(b))
+        if json.loads(a) != json.loads(b):
+            raise SystemExit("las dos salidas no coinciden")
+        print(json.dumps({
+            "db": A.db.engine.dialect.name, "filas": n, "provider": type(A.app.json).__name__,
+            "python": sys.version.split()[0],
+            "antes_us_fila": round(antes / max(n, 1) * 1e6, 2), "ahora_us_fila": round(ahora / max(n, 1) * 1e6, 2),
+            "razon": round(antes / max(ahora, 1e-9), 2),
+        }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Stub HTTP local de WASender (POST /api/send-message) para probar notify.py sin el proveedor real.
+
+    python -m bench.wasender_stub --port 8099 --latency-ms 40 --error-rate 0.05
+    WASENDER_API_BASE=http://127.0.0.1:8099 WASENDER_API_TOKEN=x python -c "import notify; ..."
+
+Con --error-rate responde 503 (o 429 con Retry-After si --rate-limit) en esa fracción de requests.
+"""
+import argparse, json, random, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+def make_server(port=0, latency_ms=0.0, error_rate=0.0, rate_limit=False):
+    counts = {"ok": 0, "error": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, como el proveedor real
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, body, headers=None):
+            out = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(out)
+
+        def do_POST(self):
+            data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)
+            if self.path != "/api/send-message":
+                return self._reply(404, {"success": False})
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                return self._reply(401, {"success": False, "message": "Unauthenticated"})
+            if random.random() < error_rate:
+                with lock: counts["error"] += 1
+                if rate_limit:
+                    return self._reply(429, {"success": False, "message": "Too Many Requests"}, {"Retry-After": "1"})
+                return self._reply(503, {"success": False, "message": "Service Unavailable"})
+            with lock: counts["ok"] += 1
+            self._reply(200, {"success": True, "data": {"to": data.get("to"), "msgId": counts["ok"]}})
+
+    srv = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    srv.counts = counts
+    return srv
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--rate-limit", action="store_true")
+    args = ap.parse_args()
+    srv = make_server(args.port, args.latency_ms, args.error_rate, args.rate_limit)
+    print(f"WASender stub en http://127.0.0.1:{srv.server_port}")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# cache.py — caché LRU con TTL en memoria del proceso (thread-safe)
+# Cada worker de gunicorn tiene la suya; el TTL acota cuánto puede quedar desactualizada.
+import threading, time
+from collections import OrderedDict
+
+_MISSING = object()
+
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expira, valor)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING and item[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not _MISSING:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0: return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[1] if item else None
+
+    def invalidate(self, pred):
+        """Elimina las entradas cuyo valor cumple pred(valor); devuelve cuántas."""
+        with self._lock:
+            keys = [k for k, (_, v) in self._data.items() if pred(v)]
+            for k in keys: del self._data[k]
+        return len(keys)
+
+    def invalidate_keys(self, pred):
+        """Elimina las entradas cuya clave cumple pred(clave); devuelve cuántas."""
+        with self._lock:
+            keys = [k for k in self._data if pred(k)]
+            for k in keys: del self._data[k]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl,
+            "hits": self.hits, "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,96 @@
+# compress.py — compresión negociada (br/gzip) de respuestas grandes, también en streaming
+# Solo tipos de texto (JSON, CSV, text/*) y solo si el cliente la acepta. Las respuestas en memoria se
+# comprimen desde COMPRESS_MIN_BYTES; las en streaming siempre (no se conoce el tamaño y suelen ser grandes).
+# Brotli se usa si está instalado el paquete `brotli` (opcional); si no, gzip.
+#
+# ENV:
+#   COMPRESS_MIN_BYTES=2048   por debajo no se comprime (/health, errores, páginas chicas)
+#   COMPRESS_LEVEL=6          nivel gzip (1-9)
+#   COMPRESS_BR_QUALITY=4     calidad brotli (0-11; >5 cuesta mucho CPU por request)
+import os, zlib
+from metrics import registry as _metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "2048"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+COMPRESS_BR_QUALITY = int(os.getenv("COMPRESS_BR_QUALITY", "4"))
+COMPRIMIBLES = ("application/json", "text/", "application/x-ndjson", "application/javascript")
+
+_metrics.counter("noa_compression_bytes_in_total", "Bytes antes de comprimir, por encoding")
+_metrics.counter("noa_compression_bytes_saved_total", "Bytes ahorrados por la compresión, por encoding")
+
+class _Compresor:
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=COMPRESS_BR_QUALITY)
+        else:
+            self._c = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)  # wbits=31 -> gzip
+
+    def comprimir(self, data):
+        return self._c.process(data) if self.encoding == "br" else self._c.compress(data)
+
+    def fin(self):
+        return self._c.finish() if self.encoding == "br" else self._c.flush()
+
+def _registrar(encoding, n_in, n_out):
+    _metrics.inc("noa_compression_bytes_in_total", {"encoding": encoding}, n_in)
+    _metrics.inc("noa_compression_bytes_saved_total", {"encoding": encoding}, n_in - n_out)
+
+def _stream(it, encoding):
+    c = _Compresor(encoding)
+    n_in = n_out = 0
+    try:
+        for chunk in it:
+            if isinstance(chunk, str): chunk = chunk.encode("utf-8")
+            n_in += len(chunk)
+            out = c.comprimir(chunk)
+            if out:
+                n_out += len(out)
+                yield out
+        out = c.fin()
+        n_out += len(out)
+        yield out
+        _registrar(encoding, n_in, n_out)
+    finally:
+        if hasattr(it, "close"): it.close()
+
+def elegir_encoding(accept_encodings):
+    ofrecidos = (["br"] if brotli else []) + ["gzip"]
+    return accept_encodings.best_match(ofrecidos)
+
+def comprimir_respuesta(resp, request):
+    """after_request: comprime resp in-place si corresponde y la devuelve."""
+    if request.method == "HEAD" or resp.status_code < 200 or resp.status_code in (204, 206, 304):
+        return resp
+    if "Content-Encoding" in resp.headers or "no-transform" in resp.headers.get("Cache-Control", ""):
+        return resp
+    if not (resp.mimetype or "").startswith(COMPRIMIBLES):
+        return resp
+    if not resp.is_streamed and resp.calculate_content_length() is not None \
+            and resp.calculate_content_length() < COMPRESS_MIN_BYTES:
+        return resp
+    resp.vary.add("Accept-Encoding")
+    encoding = elegir_encoding(request.accept_encodings)
+    if not encoding:
+        return resp
+
+    if resp.is_streamed:
+        resp.response = _stream(resp.response, encoding)
+        resp.headers.pop("Content-Length", None)
+    else:
+        data = resp.get_data()
+        c = _Compresor(encoding)
+        out = c.comprimir(data) + c.fin()
+        _registrar(encoding, len(data), len(out))
+        resp.set_data(out)
+    resp.headers["Content-Encoding"] = encoding
+    # otra representación de los mismos datos: el ETag pasa a débil (If-None-Match compara en forma débil)
+    etag, weak = resp.get_etag()
+    if etag and not weak:
+        resp.set_etag(etag, weak=True)
+    return resp
@@ -0,0 +1,92 @@
+# dbpool.py — opciones del engine desde env + tiempos de espera del pool
+# Defaults pensados para gunicorn 2 workers × 2 threads: cada proceso necesita ~2 conexiones
+# (más el probe de /health y algún stream largo), no las 5+10 por defecto de SQLAlchemy.
+#
+# ENV (solo PostgreSQL; SQLite usa el pool por defecto):
+#   DB_POOL_SIZE=3               conexiones fijas por proceso
+#   DB_MAX_OVERFLOW=2            extra temporales
+#   DB_POOL_TIMEOUT=10           segundos esperando una conexión libre antes de error
+#   DB_POOL_RECYCLE=1800         segundos máximos de vida de una conexión
+#   DB_STATEMENT_TIMEOUT_MS=30000  statement_timeout de las transacciones de requests web (0 = sin límite);
+#                                db-setup, los comandos flask y alembic corren sin límite (CREATE INDEX
+#                                CONCURRENTLY o esperar el advisory lock de otro deploy tardan más)
+#   DB_PGBOUNCER=0               1 = PgBouncer en modo transaction: sin pool propio (NullPool), sin prepared statements
+import os, time, threading
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool, NullPool
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "3"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "2"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"
+
+class PoolStats:
+    """Cuánto esperan los threads por una conexión del pool (por proceso)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = self.timeouts = 0
+        self.wait_total = self.wait_max = 0.0
+
+    def registrar(self, espera, timeout=False):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += espera
+            self.wait_max = max(self.wait_max, espera)
+            if timeout: self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts, "timeouts": self.timeouts,
+                "espera_total_ms": round(self.wait_total * 1000, 2),
+                "espera_media_ms": round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                "espera_max_ms": round(self.wait_max * 1000, 2),
+            }
+
+stats = PoolStats()
+
+class MeteredQueuePool(QueuePool):
+    # _do_get es donde QueuePool bloquea esperando una conexión libre
+    def _do_get(self):
+        t = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            stats.registrar(time.perf_counter() - t, timeout=True)
+            raise
+        stats.registrar(time.perf_counter() - t)
+        return conn
+
+def engine_options(url):
+    """SQLALCHEMY_ENGINE_OPTIONS para la URL (ya normalizada)."""
+    if not url.startswith("postgresql"):
+        return {"pool_pre_ping": True}
+    if DB_PGBOUNCER:
+        # PgBouncer ya hace el pool; en modo transaction no sobreviven prepared statements ni SETs de sesión
+        return {"poolclass": NullPool, "connect_args": {"prepare_threshold": None}}
+    return {
+        "poolclass": MeteredQueuePool, "pool_pre_ping": True,
+        "pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT, "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+def instalar(engine, en_request):
+    """statement_timeout con SET LOCAL en cada transacción que se abre dentro de un request (en_request()).
+    No va como opción de conexión: la heredarían db-setup y los comandos de mantenimiento del mismo engine."""
+    if engine.dialect.name != "postgresql" or DB_STATEMENT_TIMEOUT_MS <= 0:
+        return
+    @event.listens_for(engine, "begin")
+    def _timeout_local(conn):
+        if en_request():
+            # directo al driver: no pasa por los eventos de cursor (no cuenta en X-DB-Queries ni en el presupuesto)
+            conn.connection.driver_connection.execute(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+
+def status(engine):
+    pool = engine.pool
+    out = {"pool": type(pool).__name__, **stats.snapshot()}
+    if isinstance(pool, QueuePool):
+        out.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow(),
+                   disponibles=pool.checkedin())
+    return out
@@ -0,0 +1,51 @@
+# fastjson.py — proveedor JSON de Flask: orjson si está instalado, si no el de stdlib
+# Los dos emiten datetime/date en ISO 8601 (el de Flask por defecto usaba formato HTTP), así los
+# serializadores pueden devolver fechas nativas sin isoformat() por fila y la salida no cambia
+# según qué proveedor quedó activo.
+import dataclasses, decimal, uuid
+from datetime import date
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(o):
+    if isinstance(o, date):  # incluye datetime
+        return o.isoformat()
+    if isinstance(o, decimal.Decimal):
+        return float(o)
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+class IsoJSONProvider(DefaultJSONProvider):
+    default = staticmethod(_default)
+
+class OrjsonProvider(DefaultJSONProvider):
+    """orjson serializa dict/list/float/datetime en C; lo que no conoce pasa por _default."""
+    def _opts(self, indent=False):
+        opts = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys: opts |= orjson.OPT_SORT_KEYS
+        if indent: opts |= orjson.OPT_INDENT_2
+        return opts
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self._opts(kwargs.get("indent"))).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        # bytes directo a la respuesta: sin decodificar/re-encodificar
+        return self._app.response_class(orjson.dumps(obj, default=_default, option=self._opts(indent)) + b"\n",
+                                        mimetype=self.mimetype)
+
+JSONProvider = OrjsonProvider if orjson else IsoJSONProvider
@@ -0,0 +1,177 @@
+# metrics.py — métricas en formato de texto de Prometheus, sin dependencias
+# Cada proceso acumula en memoria (un lock, microsegundos por operación). Con varios workers de gunicorn
+# cada uno vuelca su snapshot a METRICS_DIR/<pid>.json cada METRICS_FLUSH_SEC y /metrics suma todos
+# los archivos: contadores e histogramas de workers muertos se conservan, los gauges solo de procesos vivos.
+#
+# ENV:
+#   METRICS_DIR=             carpeta compartida entre workers (vacía = solo este proceso); limpiarla en cada deploy
+#   METRICS_FLUSH_SEC=5      frecuencia máxima de volcado a disco por proceso
+import os, json, time, math, threading, atexit
+
+METRICS_DIR = os.getenv("METRICS_DIR", "").strip()
+METRICS_FLUSH_SEC = float(os.getenv("METRICS_FLUSH_SEC", "5"))
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+class Registry:
+    def __init__(self, directory=METRICS_DIR, flush_sec=METRICS_FLUSH_SEC):
+        self.directory = directory
+        self.flush_sec = flush_sec
+        self._lock = threading.Lock()
+        self._meta = {}        # nombre -> (tipo, ayuda, buckets)
+        self._counters = {}    # (nombre, labels) -> valor
+        self._gauges = {}
+        self._hists = {}       # (nombre, labels) -> [conteos por bucket..., suma, total]
+        self._last_flush = 0.0
+
+    # ---- declaración ----
+    def counter(self, name, help_):
+        self._meta[name] = ("counter", help_, None)
+
+    def gauge(self, name, help_):
+        self._meta[name] = ("gauge", help_, None)
+
+    def histogram(self, name, help_, buckets=DEFAULT_BUCKETS):
+        self._meta[name] = ("histogram", help_, tuple(buckets))
+
+    # ---- registro ----
+    def inc(self, name, labels=None, value=1.0):
+        k = _key(name, labels)
+        with self._lock:
+            self._counters[k] = self._counters.get(k, 0.0) + value
+
+    def gauge_add(self, name, value, labels=None):
+        k = _key(name, labels)
+        with self._lock:
+            self._gauges[k] = self._gauges.get(k, 0.0) + value
+
+    def observe(self, name, value, labels=None):
+        buckets = self._meta[name][2]
+        k = _key(name, labels)
+        with self._lock:
+            h = self._hists.get(k)
+            if h is None:
+                h = self._hists[k] = [0] * len(buckets) + [0.0, 0]
+            for i, b in enumerate(buckets):
+                if value <= b:
+                    h[i] += 1
+                    break
+            h[-2] += value
+            h[-1] += 1
+
+    # ---- multi-proceso ----
+    def _snapshot(self):
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "counters": [[n, l, v] for (n, l), v in self._counters.items()],
+                "gauges": [[n, l, v] for (n, l), v in self._gauges.items()],
+                "hists": [[n, l, list(h)] for (n, l), h in self._hists.items()],
+            }
+
+    def flush(self, force=False):
+        """Vuelca el snapshot de este proceso (a lo sumo cada flush_sec salvo force)."""
+        if not self.directory: return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_sec: return
+        self._last_flush = now
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{os.getpid()}.json")
+            tmp = path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._snapshot(), f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def _snapshots(self):
+        yo = self._snapshot()
+        out = [yo]
+        if not self.directory or not os.path.isdir(self.directory): return out
+        for fn in os.listdir(self.directory):
+            if not fn.endswith(".json") or fn == f"{yo['pid']}.json": continue
+            try:
+                with open(os.path.join(self.directory, fn)) as f:
+                    out.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return out
+
+    # ---- exposición ----
+    def render(self):
+        counters, gauges, hists = {}, {}, {}
+        for snap in self._snapshots():
+            vivo = snap["pid"] == os.getpid() or _vivo(snap["pid"])
+            for n, l, v in snap["counters"]:
+                k = (n, tuple(map(tuple, l)))
+                counters[k] = counters.get(k, 0.0) + v
+            if vivo:
+                for n, l, v in snap["gauges"]:
+                    k = (n, tuple(map(tuple, l)))
+                    gauges[k] = gauges.get(k, 0.0) + v
+            for n, l, h in snap["hists"]:
+                k = (n, tuple(map(tuple, l)))
+                acc = hists.get(k)
+                hists[k] = list(h) if acc is None else [a + b for a, b in zip(acc, h)]
+
+        lines = []
+        for name, (tipo, help_, buckets) in sorted(self._meta.items()):
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} {tipo}")
+            if tipo == "histogram":
+                for (n, l), h in sorted(hists.items()):
+                    if n != name: continue
+                    acum = 0
+                    for b, c in zip(buckets, h):
+                        acum += c
+                        lines.append(f"{name}_bucket{_labels(l, le=_fmt(b))} {acum}")
+                    lines.append(f"{name}_bucket{_labels(l, le='+Inf')} {h[-1]}")
+                    lines.append(f"{name}_sum{_labels(l)} {_fmt(h[-2])}")
+                    lines.append(f"{name}_count{_labels(l)} {h[-1]}")
+            else:
+                for (n, l), v in sorted((counters if tipo == "counter" else gauges).items()):
+                    if n == name: lines.append(f"{name}{_labels(l)} {_fmt(v)}")
+        return "\n".join(lines) + "\n"
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+def _fmt(v):
+    if v == math.inf: return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+def _esc(v):
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(l, **extra):
+    items = list(l) + list(extra.items())
+    if not items: return ""
+    return "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in items) + "}"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = Registry()
+atexit.register(registry.flush, True)
+
+# ---- métricas compartidas (las usan app.py, passwords.py y worker.py) ----
+registry.counter("noa_http_requests_total", "Requests HTTP por ruta, método y status")
+registry.histogram("noa_http_request_duration_seconds", "Latencia por ruta y método (hasta armar la respuesta)")
+registry.gauge("noa_http_requests_in_flight", "Requests en curso")
+registry.histogram("noa_db_time_seconds", "Tiempo en la DB por request, por ruta")
+registry.histogram("noa_db_queries_per_request", "Sentencias SQL por request, por ruta",
+                   buckets=(1, 2, 3, 5, 10, 25, 50, 100))
+registry.counter("noa_db_query_budget_exceeded_total", "Requests que superaron SQL_QUERY_BUDGET o SQL_REPEAT_LIMIT")
+registry.histogram("noa_bcrypt_seconds", "Tiempo de bcrypt (incluye espera del pool) por operación",
+                   buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+registry.counter("noa_worker_runs_total", "Corridas del job de recordatorios")
+registry.counter("noa_worker_waves_total", "Recordatorios enviados por wave")
+registry.counter("noa_worker_notifications_total", "Notificaciones por resultado (ok|error)")
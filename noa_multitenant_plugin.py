@@ -26,47 +26,13 @@ class OrgMembership(db.Model):
     org_id  = db.Column(db.String(36), db.ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False)
     role    = db.Column(db.String(20), nullable=False)  # owner/manager/agent/viewer/suspended
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (db.Index("uq_org_memberships_user_org", "user_id", "org_id", unique=True),)
 
-# --------------------- HELPERS SIMPLES ---------------------
-def _hash_password(raw: str):
-    try:
-        from werkzeug.security import generate_password_hash
-        return generate_password_hash(raw)
-    except:
-        return raw  # fallback (no recomendado, pero no rompe)
-
-def _get_user_by_username(username):
-    return User.query.filter_by(username=username).first()
-
-def _get_user_by_email(email):
-    return User.query.filter_by(email=email).first() if hasattr(User, "email") else None
-
-def _set_password(u: User, raw: str):
-    hashed = _hash_password(raw)
-    if hasattr(u, "password_hash"):
-        u.password_hash = hashed
-    elif hasattr(u, "password"):
-        u.password = hashed
-    db.session.commit()
-
-def _ensure_user(username, email, password, is_admin=False):
-    u = _get_user_by_username(username) or (email and _get_user_by_email(email))
-    if not u:
-        kwargs = dict(username=username)
-        if hasattr(User, "email"): kwargs["email"] = email
-        if hasattr(User, "is_active"): kwargs["is_active"] = True
-        if hasattr(User, "is_admin"):  kwargs["is_admin"]  = is_admin
-        if hasattr(User, "password_hash"):
-            kwargs["password_hash"] = _hash_password(password)
-        else:
-            kwargs["password"] = _hash_password(password)
-        u = User(**kwargs)
-        db.session.add(u)
-        db.session.commit()
-    else:
-        _set_password(u, password)
-    return u
+from org_access import OrgAccess, ensure_indexes as _ensure_org_indexes
+from seed import seed_users_locked
+_access = OrgAccess(db, User, Organization, OrgMembership)
 
+# --------------------- HELPERS SIMPLES ---------------------
 def _require_bearer_token():
     auth = request.headers.get("Authorization","")
     if not auth.startswith("Bearer "):
@@ -82,14 +48,20 @@ def _decode_jwt(token):
         # Fallback mínimo (permite avanzar en desarrollo)
         return {"sub": None, "roles": []}
 
-def _me_user():
+def _current_user_id():
+    # solo decodifica el token; no toca la DB
     token = _require_bearer_token()
     if not token:
         return None
     claims = _decode_jwt(token)
-    if not claims or "sub" not in claims:
+    if not claims or claims.get("sub") is None:
         return None
-    return User.query.get(claims["sub"])
+    sub = claims["sub"]
+    return int(sub) if isinstance(sub, str) and sub.isdigit() else sub
+
+def _me_user():
+    uid = _current_user_id()
+    return User.query.get(uid) if uid is not None else None
 
 # --------------------- RUTAS ---------------------
 def register_routes(app):
@@ -106,19 +78,19 @@ def register_routes(app):
         db.session.add(org); db.session.commit()
         db.session.add(OrgMembership(user_id=me.id, org_id=org.id, role="owner"))
         db.session.commit()
+        _access.invalidate(user_id=me.id, org_id=org.id)
         return jsonify({"id": org.id, "name": org.name, "status": org.status})
 
     @app.route("/orgs/<org_id>/users", methods=["POST"])
     def org_add_user(org_id):
-        me = _me_user()
-        if not me:
+        # una sola consulta (usuario + estado de la org + rol), cacheada por (usuario, org)
+        uid = _current_user_id()
+        acc = _access.get(uid, org_id) if uid is not None else None
+        if not acc:
             return jsonify({"error":"unauthorized"}), 401
-        org = Organization.query.get(org_id)
-        if not org or org.status != "active":
+        if acc.org_status != "active":
             return jsonify({"error":"org not found"}), 404
-
-        my_mem = OrgMembership.query.filter_by(user_id=me.id, org_id=org_id).first()
-        if not my_mem or my_mem.role not in ("owner","manager"):
+        if acc.role not in ("owner","manager"):
             return jsonify({"error":"forbidden"}), 403
 
         data = request.get_json(force=True) or {}
@@ -138,18 +110,18 @@ def register_routes(app):
         else:
             mem.role = role
         db.session.commit()
+        _access.invalidate(user_id=user.id, org_id=org_id)
         return jsonify({"username": user.username, "role": role})
 
     @app.route("/orgs/<org_id>/users", methods=["GET"])
     def org_list_users(org_id):
-        me = _me_user()
-        if not me:
+        uid = _current_user_id()
+        acc = _access.get(uid, org_id) if uid is not None else None
+        if not acc:
             return jsonify({"error":"unauthorized"}), 401
-        org = Organization.query.get(org_id)
-        if not org or org.status != "active":
+        if acc.org_status != "active":
             return jsonify({"error":"org not found"}), 404
-        my_mem = OrgMembership.query.filter_by(user_id=me.id, org_id=org_id).first()
-        if not my_mem:
+        if not acc.role:
             return jsonify({"error":"forbidden"}), 403
 
         q = db.session.query(User.username, OrgMembership.role).join(
@@ -158,17 +130,24 @@ def register_routes(app):
         return jsonify([{"username": u, "role": r} for (u, r) in q.all()])
 
 # --------------------- INICIALIZACIÓN ÚNICA ---------------------
-def init(app):
-    # crea tablas nuevas + usuarios semilla
+def setup(app):
+    """Tablas de orgs + usuarios semilla. En el deploy lo hace `flask --app app noa-seed` (app.py, Procfile release)."""
     with app.app_context():
         db.create_all()
-        admin_user = os.getenv("ADMIN_USERNAME", "tony")
-        admin_email = os.getenv("ADMIN_EMAIL", "vtonyb@gmail.com")
-        admin_pass  = os.getenv("ADMIN_PASSWORD", "Noa2025!")
-        _ensure_user(admin_user, admin_email, admin_pass, True)
-        _ensure_user("jeff",    "jeff@noa.seg",    "Noa2025!", False)
-        _ensure_user("hermann", "hermann@noa.seg", "Noa2025!", False)
-        print("[noa] seed OK (tony/jeff/hermann)")
+        _ensure_org_indexes(db)
+        r = seed_users_locked(db, User)
+    print(f"[noa] seed OK en {r['segundos']}s (creados={r['creados']} actualizados={r['actualizados']} "
+          f"sin_cambios={r['sin_cambios']})")
+    return r
+
+def init(app):
+    @app.cli.command("noa-seed")
+    def _noa_seed_cmd():
+        setup(app)
+
+    # en cada worker solo si se pide explícitamente (p. ej. desarrollo local)
+    if os.getenv("NOA_SEED_ON_START", "0") == "1":
+        setup(app)
 
     # registra rutas /orgs
     register_routes(app)
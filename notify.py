@@ -1,16 +1,166 @@
-import os, requests
+# notify.py — cliente WhatsApp (WASender) reutilizable
+# Conexiones keep-alive (pool), timeouts por request, reintentos con jitter para errores
+# transitorios, circuit breaker cuando el proveedor está degradado y envío en lote.
+# El POST no es idempotente: solo se reintenta si seguro no llegó al proveedor (no conectó, 429, 503).
+# Un timeout de lectura, una conexión cortada o un 500/502/504 pueden venir de un mensaje ya entregado.
+#
+# ENV:
+#   WASENDER_API_BASE=https://www.wasenderapi.com   (un stub local sirve: python -m bench.wasender_stub)
+#   WASENDER_API_TOKEN / WASENDER_API_KEY
+#   WASENDER_TIMEOUT=25          segundos de lectura (conexión: 5)
+#   WASENDER_MAX_RETRIES=3
+#   WASENDER_BREAKER_FAILS=5     fallos seguidos que abren el circuito
+#   WASENDER_BREAKER_COOLDOWN=30 segundos con el circuito abierto antes de probar de nuevo
+import os, time, random, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+
+TRANSIENT_STATUS = {429, 500, 502, 503, 504}  # proveedor degradado: cuentan para el circuit breaker
+RETRY_STATUS = {429, 503}                     # rechazados sin procesar: se pueden reintentar
+
+def _no_enviado(exc):
+    """True si el request no llegó a salir (no se pudo conectar); reintentarlo no duplica el mensaje."""
+    if isinstance(exc, requests.ConnectTimeout): return True
+    if isinstance(exc, requests.Timeout): return False  # ReadTimeout: el proveedor pudo haberlo entregado
+    reason = getattr(exc.args[0], 'reason', None) if exc.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+class CircuitOpen(RuntimeError):
+    """El proveedor falló demasiadas veces seguidas; no se envía hasta que pase el cooldown."""
+
+class WhatsAppClient:
+    def __init__(self, base=None, api_key=None, timeout=None, max_retries=None, pool_size=10,
+                 breaker_fails=None, breaker_cooldown=None, backoff_base=0.5, backoff_max=20.0):
+        self.base = (base or os.getenv('WASENDER_API_BASE', 'https://www.wasenderapi.com')).rstrip('/')
+        self.api_key = api_key or os.getenv('WASENDER_API_TOKEN') or os.getenv('WASENDER_API_KEY')
+        if not self.api_key:
+            raise RuntimeError('Falta WASENDER_API_TOKEN o WASENDER_API_KEY')
+        self.timeout = timeout or (5.0, float(os.getenv('WASENDER_TIMEOUT', '25')))
+        self.max_retries = int(os.getenv('WASENDER_MAX_RETRIES', '3')) if max_retries is None else max_retries
+        self.breaker_fails = breaker_fails or int(os.getenv('WASENDER_BREAKER_FAILS', '5'))
+        self.breaker_cooldown = breaker_cooldown or float(os.getenv('WASENDER_BREAKER_COOLDOWN', '30'))
+        self.backoff_base, self.backoff_max = backoff_base, backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        })
+
+        self._lock = threading.Lock()
+        self._fails = 0
+        self._open_until = 0.0
+        self._probing = False  # semiabierto: ya hay un request de prueba en vuelo
+        self._lat = deque(maxlen=2000)
+        self._t0 = time.monotonic()
+        self._sent = self._errors = self._retries = self._rejected = 0
+
+    # ---- circuit breaker ----
+    def _check_circuit(self):
+        with self._lock:
+            if self._fails < self.breaker_fails:
+                return
+            if time.monotonic() < self._open_until:
+                self._rejected += 1
+                raise CircuitOpen(f'WASender degradado; reintentar en {self._open_until - time.monotonic():.0f}s')
+            # pasado el cooldown queda semiabierto: pasa un solo request de prueba y su resultado
+            # (en _record) cierra o reabre el circuito; los demás se rechazan mientras tanto
+            if self._probing:
+                self._rejected += 1
+                raise CircuitOpen('WASender degradado; probando si se recuperó')
+            self._probing = True
+
+    def _record(self, ok, latency=None, provider_ok=None):
+        # provider_ok: si el proveedor respondió sano (un 4xx del mensaje no abre el circuito)
+        provider_ok = ok if provider_ok is None else provider_ok
+        with self._lock:
+            self._probing = False
+            if latency is not None:
+                self._lat.append(latency)
+            if ok:
+                self._sent += 1
+            else:
+                self._errors += 1
+            if provider_ok:
+                self._fails = 0
+            else:
+                self._fails += 1
+                if self._fails >= self.breaker_fails:
+                    self._open_until = time.monotonic() + self.breaker_cooldown
+
+    def _sleep_backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            wait = min(retry_after, self.backoff_max)
+        else:
+            wait = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))  # full jitter
+        with self._lock:
+            self._retries += 1
+        time.sleep(wait)
+
+    # ---- API ----
+    def send(self, to, text):
+        """Envía un mensaje; devuelve el JSON del proveedor o lanza (HTTPError, RequestException, CircuitOpen)."""
+        url = f'{self.base}/api/send-message'
+        for attempt in range(self.max_retries + 1):
+            self._check_circuit()
+            t = time.perf_counter()
+            try:
+                r = self.session.post(url, json={'to': to, 'text': text}, timeout=self.timeout)
+            except requests.RequestException as e:  # todo fallo pasa por _record (libera la prueba)
+                self._record(False, time.perf_counter() - t)
+                if attempt == self.max_retries or not _no_enviado(e):
+                    raise
+                self._sleep_backoff(attempt)
+                continue
+            if r.status_code in RETRY_STATUS and attempt < self.max_retries:
+                self._record(False, time.perf_counter() - t)
+                ra = r.headers.get('Retry-After')
+                self._sleep_backoff(attempt, float(ra) if ra and ra.isdigit() else None)
+                continue
+            self._record(r.ok, time.perf_counter() - t, provider_ok=r.ok or r.status_code not in TRANSIENT_STATUS)
+            r.raise_for_status()
+            return r.json()
+
+    def send_many(self, mensajes, concurrency=4):
+        """mensajes: [(to, text)]. Devuelve [{"to", "ok", "resp"|"error"}] en el mismo orden; no lanza."""
+        def one(m):
+            to, text = m
+            try:
+                return {'to': to, 'ok': True, 'resp': self.send(to, text)}
+            except Exception as e:
+                return {'to': to, 'ok': False, 'error': f'{type(e).__name__}: {e}'}
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+            return list(ex.map(one, mensajes))
+
+    def stats(self):
+        with self._lock:
+            lat = sorted(self._lat)
+            elapsed = time.monotonic() - self._t0
+            pct = lambda p: round(lat[min(len(lat) - 1, int(len(lat) * p))] * 1000, 2) if lat else None
+            return {
+                'enviados': self._sent, 'errores': self._errors, 'reintentos': self._retries,
+                'rechazados_circuito': self._rejected,
+                'circuito': 'abierto' if self._fails >= self.breaker_fails and time.monotonic() < self._open_until
+                            else ('semiabierto' if self._fails >= self.breaker_fails else 'cerrado'),
+                'latencia_p50_ms': pct(0.5), 'latencia_p95_ms': pct(0.95), 'latencia_p99_ms': pct(0.99),
+                'msgs_por_seg': round(self._sent / elapsed, 2) if elapsed > 0 else 0.0,
+            }
+
+_default = None
+_default_lock = threading.Lock()
+
+def get_client():
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = WhatsAppClient()
+        return _default
 
 def send_whatsapp(to, text):
-    base = os.getenv('WASENDER_API_BASE', 'https://www.wasenderapi.com')
-    api_key = os.getenv('WASENDER_API_TOKEN') or os.getenv('WASENDER_API_KEY')
-    if not api_key:
-        raise RuntimeError('Falta WASENDER_API_TOKEN o WASENDER_API_KEY')
-    url = f"{base.rstrip('/')}/api/send-message"
-    headers = {
-        'Authorization': f'Bearer {api_key}',
-        'Content-Type': 'application/json'
-    }
-    payload = {'to': to, 'text': text}
-    r = requests.post(url, json=payload, headers=headers, timeout=25)
-    r.raise_for_status()
-    return r.json()
+    return get_client().send(to, text)
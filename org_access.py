@@ -0,0 +1,50 @@
+# org_access.py — autorización de /orgs/<org_id>/... en una sola consulta, cacheada por (usuario, org)
+# Se instancia con los modelos de cada módulo de rutas (org_routes.py, noa_multitenant_plugin.py, org).
+import os
+from collections import namedtuple
+from sqlalchemy import and_, text
+from cache import TTLCache
+
+ORG_ACCESS_TTL = float(os.getenv("ORG_ACCESS_TTL", "30"))
+ORG_ACCESS_CACHE_SIZE = int(os.getenv("ORG_ACCESS_CACHE_SIZE", "10000"))
+
+# org_status None = la org no existe; role None = el usuario no es miembro
+Acceso = namedtuple("Acceso", "user_id org_status role")
+_MISS = object()
+
+class OrgAccess:
+    def __init__(self, db, User, Organization, OrgMembership):
+        self.db, self.User, self.Organization, self.OrgMembership = db, User, Organization, OrgMembership
+        self.cache = TTLCache(ORG_ACCESS_CACHE_SIZE, ORG_ACCESS_TTL)
+
+    def get(self, user_id, org_id):
+        """Acceso(user_id, org_status, role) o None si el usuario no existe."""
+        key = (str(user_id), str(org_id))
+        hit = self.cache.get(key, _MISS)
+        if hit is not _MISS:
+            return hit
+        User, Org, Mem = self.User, self.Organization, self.OrgMembership
+        row = self.db.session.query(User.id, Org.status, Mem.role) \
+            .select_from(User) \
+            .outerjoin(Org, Org.id == org_id) \
+            .outerjoin(Mem, and_(Mem.user_id == User.id, Mem.org_id == org_id)) \
+            .filter(User.id == user_id).first()
+        acc = Acceso(*row) if row else None
+        self.cache.set(key, acc)
+        return acc
+
+    def invalidate(self, user_id=None, org_id=None):
+        """Llamar al cambiar membresías u orgs (solo afecta a la caché de este proceso)."""
+        u = None if user_id is None else str(user_id)
+        o = None if org_id is None else str(org_id)
+        return self.cache.invalidate_keys(lambda k: (u is None or k[0] == u) and (o is None or k[1] == o))
+
+def ensure_indexes(db, logger=None):
+    """Índice único (user_id, org_id) en org_memberships para tablas creadas antes de tenerlo."""
+    try:
+        db.session.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_org_memberships_user_org ON org_memberships (user_id, org_id)"))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        (logger.error if logger else print)(f"ensure org indexes error: {e}")
@@ -2,6 +2,9 @@
 from flask import request, jsonify
 from models import db, User
 from models import Organization, OrgMembership  # los agregas en el paso 2.3-A (abajo)
+from org_access import OrgAccess
+
+_access = OrgAccess(db, User, Organization, OrgMembership)
 
 def register_org_routes(app):
 
@@ -19,14 +22,20 @@ def register_org_routes(app):
         except:
             return {"sub": None, "roles": []}
 
-    def _get_current_user():
+    def _current_user_id():
+        # solo decodifica el token; no toca la DB
         token = _require_bearer_token()
         if not token:
             return None
         claims = _decode_jwt(token)
-        if not claims or "sub" not in claims:
+        if not claims or claims.get("sub") is None:
             return None
-        return User.query.get(claims["sub"])
+        sub = claims["sub"]
+        return int(sub) if isinstance(sub, str) and sub.isdigit() else sub
+
+    def _get_current_user():
+        uid = _current_user_id()
+        return User.query.get(uid) if uid is not None else None
 
     @app.route("/orgs", methods=["POST"])
     def create_org():
@@ -41,20 +50,19 @@ def register_org_routes(app):
         db.session.add(org); db.session.commit()
         db.session.add(OrgMembership(user_id=me.id, org_id=org.id, role="owner"))
         db.session.commit()
+        _access.invalidate(user_id=me.id, org_id=org.id)
         return jsonify({"id": org.id, "name": org.name, "status": org.status})
 
     @app.route("/orgs/<org_id>/users", methods=["POST"])
     def org_add_user(org_id):
-        me = _get_current_user()
-        if not me:
+        # una sola consulta (usuario + estado de la org + rol), cacheada por (usuario, org)
+        uid = _current_user_id()
+        acc = _access.get(uid, org_id) if uid is not None else None
+        if not acc:
             return jsonify({"error":"unauthorized"}), 401
-
-        org = Organization.query.get(org_id)
-        if not org or org.status != "active":
+        if acc.org_status != "active":
             return jsonify({"error":"org not found"}), 404
-
-        my_mem = OrgMembership.query.filter_by(user_id=me.id, org_id=org_id).first()
-        if not my_mem or my_mem.role not in ("owner","manager"):
+        if acc.role not in ("owner","manager"):
             return jsonify({"error":"forbidden"}), 403
 
         data = request.get_json(force=True) or {}
@@ -74,19 +82,18 @@ def register_org_routes(app):
         else:
             mem.role = role
         db.session.commit()
+        _access.invalidate(user_id=user.id, org_id=org_id)
         return jsonify({"username": user.username, "role": role})
 
     @app.route("/orgs/<org_id>/users", methods=["GET"])
     def org_list_users(org_id):
-        me = _get_current_user()
-        if not me:
+        uid = _current_user_id()
+        acc = _access.get(uid, org_id) if uid is not None else None
+        if not acc:
             return jsonify({"error":"unauthorized"}), 401
-        org = Organization.query.get(org_id)
-        if not org or org.status != "active":
+        if acc.org_status != "active":
             return jsonify({"error":"org not found"}), 404
-
-        my_mem = OrgMembership.query.filter_by(user_id=me.id, org_id=org_id).first()
-        if not my_mem:
+        if not acc.role:
             return jsonify({"error":"forbidden"}), 403
 
         q = db.session.query(User.username, OrgMembership.role).join(
@@ -0,0 +1,85 @@
+# passwords.py — bcrypt fuera de los threads de request
+# bcrypt es CPU puro: se ejecuta en un pool de procesos acotado para que un pico de logins
+# no ocupe todos los threads de gunicorn. Hasta PASSWORD_MAX_PENDING operaciones (en curso + en cola)
+# por worker de gunicorn; las demás esperan cupo hasta PASSWORD_QUEUE_TIMEOUT segundos y recién ahí
+# se lanza PasswordBusy y la ruta responde 503. El thread del request queda esperando el hash, así que
+# con MAX_PENDING >= --threads un pico de logins puede ocupar todos los threads de un worker por unos
+# cientos de ms: si eso molesta, subir --threads en vez de bajar la cola.
+# Los procesos del pool (forkserver) reimportan el script principal: scripts propios que importen
+# app.py deben usar `if __name__ == "__main__":` o correr con PASSWORD_WORKERS=0.
+#
+# ENV:
+#   BCRYPT_ROUNDS=12           costo para hashes nuevos (y rehash al hacer login)
+#   PASSWORD_WORKERS=1         procesos del pool (0 = en el mismo thread, como antes)
+#   PASSWORD_MAX_PENDING=2×workers  operaciones en curso + en cola por worker de gunicorn
+#   PASSWORD_QUEUE_TIMEOUT=3   segundos máximos esperando cupo (0 = sin esperar)
+import os, time, threading, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+from metrics import registry as _metrics
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "1"))
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", str(max(PASSWORD_WORKERS, 1) * 2)))
+PASSWORD_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_QUEUE_TIMEOUT", "3"))
+
+class PasswordBusy(Exception):
+    """No hubo cupo en el pool de hashing dentro del timeout."""
+
+def _hash(raw: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(raw, bcrypt.gensalt(rounds))
+
+def _check(raw: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(raw, hashed)
+
+_pool = None
+_pool_pid = None
+_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(PASSWORD_MAX_PENDING)
+
+def _executor():
+    # Se crea perezosamente en cada proceso (después del fork de gunicorn)
+    global _pool, _pool_pid
+    if PASSWORD_WORKERS <= 0: return None
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _pool = ProcessPoolExecutor(max_workers=PASSWORD_WORKERS, mp_context=ctx)
+            _pool_pid = os.getpid()
+        return _pool
+
+def _run(fn, *args):
+    ex = _executor()
+    if ex is None: return fn(*args)
+    if not _slots.acquire(timeout=PASSWORD_QUEUE_TIMEOUT):
+        raise PasswordBusy()
+    try:
+        return ex.submit(fn, *args).result()
+    except BrokenProcessPool:
+        global _pool
+        with _lock: _pool = None
+        return fn(*args)
+    finally:
+        _slots.release()
+
+def _medido(op, fn, *args):
+    t = time.perf_counter()
+    try:
+        return _run(fn, *args)
+    finally:
+        _metrics.observe("noa_bcrypt_seconds", time.perf_counter() - t, {"op": op})
+
+def hash_password(raw: str, rounds: int = None) -> str:
+    return _medido("hash", _hash, raw.encode("utf-8"), rounds or BCRYPT_ROUNDS).decode("utf-8")
+
+def check_password(raw: str, hashed: str) -> bool:
+    return _medido("check", _check, raw.encode("utf-8"), hashed.encode("utf-8"))
+
+def needs_rehash(hashed: str) -> bool:
+    """True si el hash guardado usa un costo distinto de BCRYPT_ROUNDS ($2b$<costo>$...)."""
+    try:
+        return int(hashed.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
@@ -0,0 +1,85 @@
+# seed.py — usuarios semilla (tony/jeff/hermann) idempotentes
+# Lo usan `flask --app app noa-seed` (app.py, release del Procfile), noa_multitenant_plugin y seed_startup.
+# Un usuario que ya existe y cuyo hash verifica la contraseña semilla no se toca; el resto se escribe
+# en un solo INSERT ... ON CONFLICT (username) y un commit. Pensado para correr una vez por deploy.
+#
+# ENV:
+#   ADMIN_USERNAME / ADMIN_EMAIL / ADMIN_PASSWORD   usuario admin (tony por defecto)
+#   SEED_PASSWORD=Noa2025!                          contraseña de jeff y hermann
+import os, time
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash, check_password_hash
+
+SEED_LOCK_KEY = 72616402  # pg_advisory_lock: dos procesos no siembran a la vez
+
+def seed_users_default():
+    pw = os.getenv("SEED_PASSWORD", "Noa2025!")
+    return [
+        (os.getenv("ADMIN_USERNAME", "tony"), os.getenv("ADMIN_EMAIL", "vtonyb@gmail.com"),
+         os.getenv("ADMIN_PASSWORD", "Noa2025!"), True),
+        ("jeff", "jeff@noa.seg", pw, False),
+        ("hermann", "hermann@noa.seg", pw, False),
+    ]
+
+def _verifica(stored, raw):
+    if not stored: return False
+    try:
+        return check_password_hash(stored, raw)
+    except Exception:
+        return stored == raw  # filas viejas con la contraseña en claro
+
+def _insert(db, User):
+    if db.engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(User)
+
+def seed_users(db, User, users=None):
+    """users: [(username, email, password, is_admin)]. Devuelve {"creados", "actualizados", "sin_cambios", "segundos"}.
+    Requiere app context; hace commit."""
+    t = time.perf_counter()
+    users = seed_users_default() if users is None else users
+    pw_col = "password_hash" if hasattr(User, "password_hash") else "password"
+    has_email = hasattr(User, "email")
+
+    # una consulta para todos los semilla (por username, o por email si el modelo lo tiene)
+    names = [u[0] for u in users]
+    cond = User.username.in_(names)
+    if has_email: cond = cond | User.email.in_([u[1] for u in users if u[1]])
+    existentes = db.session.query(User).filter(cond).all()
+    por_nombre = {x.username: x for x in existentes}
+    por_email = {x.email: x for x in existentes} if has_email else {}
+
+    rows, creados, actualizados = [], 0, 0
+    for username, email, password, is_admin in users:
+        u = por_nombre.get(username) or (email and por_email.get(email))
+        if u is not None and _verifica(getattr(u, pw_col), password):
+            continue
+        row = {"username": u.username if u is not None else username, pw_col: generate_password_hash(password)}
+        if has_email: row["email"] = email
+        if hasattr(User, "is_active"): row["is_active"] = True
+        if hasattr(User, "is_admin"): row["is_admin"] = is_admin
+        rows.append(row)
+        if u is None: creados += 1
+        else: actualizados += 1
+
+    if rows:
+        stmt = _insert(db, User)
+        stmt = stmt.on_conflict_do_update(index_elements=[User.username],
+                                          set_={pw_col: getattr(stmt.excluded, pw_col)})
+        db.session.execute(stmt, rows)
+        db.session.commit()
+    return {"creados": creados, "actualizados": actualizados, "sin_cambios": len(users) - len(rows),
+            "segundos": round(time.perf_counter() - t, 3)}
+
+def seed_users_locked(db, User, users=None):
+    """seed_users bajo advisory lock (PostgreSQL): con varios workers arrancando, uno siembra y el resto ya lo ve hecho."""
+    if db.engine.dialect.name != "postgresql":
+        return seed_users(db, User, users)
+    with db.engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": SEED_LOCK_KEY})
+        try:
+            return seed_users(db, User, users)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": SEED_LOCK_KEY})
@@ -1,23 +1,40 @@
 # worker.py — Envío automático T-15, T-7 y T-0 con pausa anti-429
+# Los recordatorios vienen materializados del backend (GET /recordatorios/pendientes):
+# el costo diario depende de los que vencen hoy, no de todos los cobros.
+# Cada tanda de LEDGER_BATCH cobros se reporta al ledger (POST /recordatorios/entregas) antes de
+# seguir: si el proceso muere, la próxima corrida retoma con lo no entregado sin duplicar mensajes.
 # Acepta horario como:
 #   - CRON_TIME="2:11"  (recomendado)
 #   - o CRON_HOUR="2" y CRON_MINUTE="11"
 #
 # ENV útiles:
 #   BACKEND_URL=https://noa-cobros-backend-clean.onrender.com
-#   WAVE_DAYS=15,7,0
-#   PAUSE_SEC=12
+#   ADMIN_SECRET=    (mismo valor que en el backend; header X-Admin-Secret)
+#   WAVE_DAYS=15,7,0 (si difiere del plan del backend, se pide un re-plan una vez)
+#   PAUSE_SEC=12     (solo si no hay RATE_PER_SEC: equivale a 1 msg cada PAUSE_SEC)
+#   RATE_PER_SEC=    mensajes/segundo permitidos por el proveedor (token bucket)
+#   RATE_BURST=      ráfaga máxima del bucket (por defecto = BATCH_SIZE)
+#   CONCURRENCY=2    requests /notificar en vuelo
+#   BATCH_SIZE=1     ids por llamada a /notificar
+#   LEDGER_BATCH=50  cobros por tanda (envío + registro en el ledger)
+#   MAX_RETRIES=4    reintentos por lote ante 429/503/sin conexión (backoff exponencial o Retry-After);
+#                    cualquier otro error se registra como descartado y no se reenvía
 #   TZ=America/Costa_Rica
 #   CRON_TIME=8:00   (o CRON_HOUR=8 / CRON_MINUTE=0)
 #   RUN_ON_START=0/1 (si 1, ejecuta inmediatamente al arrancar)
 #   DRY_RUN=0/1      (si 1, solo imprime, no envía)
+#   METRICS_PORT=    (si se define, expone /metrics de este proceso; METRICS_DIR lo comparte con el backend)
 
 import os
 import time
-import json
+import random
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 import datetime as dt
 from apscheduler.schedulers.blocking import BlockingScheduler
+from metrics import registry as metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from notify import RETRY_STATUS, _no_enviado
 
 # -------- Config --------
 BACKEND = os.getenv("BACKEND_URL", "https://noa-cobros-backend-clean.onrender.com").rstrip("/")
@@ -26,6 +43,15 @@ PAUSE   = int(os.getenv("PAUSE_SEC", "12"))
 TZ      = os.getenv("TZ", "America/Costa_Rica")
 RUN_ON_START = os.getenv("RUN_ON_START", "0") == "1"
 DRY_RUN = os.getenv("DRY_RUN", "0") == "1"
+ADMIN_HEADERS = {"X-Admin-Secret": os.getenv("ADMIN_SECRET", "changeme-admin")}
+RATE    = float(os.getenv("RATE_PER_SEC") or 1.0 / max(PAUSE, 1))
+BATCH   = max(1, int(os.getenv("BATCH_SIZE", "1")))
+BURST   = float(os.getenv("RATE_BURST") or BATCH)
+CONCURRENCY = max(1, int(os.getenv("CONCURRENCY", "2")))
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("BACKOFF_BASE_SEC", "2"))
+BACKOFF_MAX  = float(os.getenv("BACKOFF_MAX_SEC", "120"))
+LEDGER_BATCH = max(1, int(os.getenv("LEDGER_BATCH", "50")))
 
 def _parse_schedule():
     """Devuelve (hour, minute) aceptando CRON_TIME='HH:MM' o H/M separados."""
@@ -43,85 +69,228 @@ def _parse_schedule():
 HOUR, MINUTE = _parse_schedule()
 
 # -------- Helpers --------
-def _get_facturas():
-    r = requests.get(f"{BACKEND}/facturas", timeout=40)
+_session = requests.Session()
+_session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=CONCURRENCY))
+_session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=CONCURRENCY))
+
+def _sync_plan():
+    """Si WAVE_DAYS cambió respecto del plan del backend, pide el re-plan (una sola vez)."""
+    r = _session.get(f"{BACKEND}/recordatorios/plan", headers=ADMIN_HEADERS, timeout=40)
+    r.raise_for_status()
+    actuales = r.json().get("waves") or []
+    if sorted(actuales) == sorted(WAVES):
+        return
+    print(f"[{dt.datetime.now()}] WAVE_DAYS cambió ({actuales} -> {WAVES}); replanificando")
+    # el backend replanifica un tramo por llamada (202 = faltan tramos); si esto se corta, retoma el cursor
+    total = 0
+    while True:
+        r = _session.post(f"{BACKEND}/recordatorios/replan", json={"waves": WAVES}, headers=ADMIN_HEADERS, timeout=60)
+        r.raise_for_status()
+        total += r.json().get("planificados") or 0
+        if r.status_code != 202:
+            break
+    print(f"[{dt.datetime.now()}] Re-plan OK: {total} recordatorios")
+
+def _get_pendientes():
+    """Recordatorios vencidos y no entregados: [{id, cobro_id, wave, send_at, intentos}]."""
+    r = _session.get(f"{BACKEND}/recordatorios/pendientes", headers=ADMIN_HEADERS, timeout=40)
     r.raise_for_status()
-    # Debe ser una lista de dicts
     return r.json()
 
-def _days_to(date_str):
+def _reportar(resultados):
+    """Registra [{id, ok, resp, reintentar}] en el ledger; reintenta porque sin registro habría reenvíos."""
+    if DRY_RUN or not resultados:
+        return
+    for attempt in range(3):
+        try:
+            r = _session.post(f"{BACKEND}/recordatorios/entregas", json={"resultados": resultados},
+                              headers=ADMIN_HEADERS, timeout=60)
+            r.raise_for_status()
+            return
+        except requests.RequestException:
+            if attempt == 2:
+                raise
+            time.sleep(_backoff(attempt, None))
+
+def _retry_after(value):
+    """Segundos de un header Retry-After (entero o fecha HTTP); None si no viene."""
+    if not value:
+        return None
     try:
-        vence = dt.date.fromisoformat(str(date_str)[:10])
-        hoy   = dt.date.today()
-        return (vence - hoy).days
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(0.0, (parsedate_to_datetime(value) - dt.datetime.now(dt.timezone.utc)).total_seconds())
     except Exception:
         return None
 
 def _post_notificar(ids):
-    """POST /notificar con lista de ids. Devuelve (ok, payload/text)."""
+    """POST /notificar con lista de ids. Devuelve (ok, payload/text, status, retry_after)."""
     url = f"{BACKEND}/notificar"
     if DRY_RUN:
-        return True, {"dry_run": True, "ids": ids}
-    r = requests.post(url, json={"ids": ids}, timeout=60)
+        return True, {"dry_run": True, "ids": ids}, 200, None
+    r = _session.post(url, json={"ids": ids}, timeout=60)
     ctype = r.headers.get("content-type", "")
     payload = r.json() if "application/json" in ctype else r.text
     ok = r.ok
-    return ok, payload
+    return ok, payload, r.status_code, _retry_after(r.headers.get("Retry-After"))
+
+def _reintentable(status, exc):
+    """/notificar no es idempotente: solo se reintenta lo que seguro no se procesó (no conectó, 429, 503)."""
+    if exc is not None:
+        return _no_enviado(exc)
+    return status in RETRY_STATUS
 
-def _contains_429(payload):
-    s = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
-    return "Too Many Requests" in s or "429" in s
+class TokenBucket:
+    """rate tokens/seg con ráfaga `burst`; pause() frena a todos los threads (p.ej. tras un 429)."""
+    def __init__(self, rate, burst):
+        self.rate, self.burst = rate, max(burst, 1.0)
+        self.tokens, self.t = self.burst, time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
 
-def _send_ids_slow(ids, pause_sec):
-    """Envía de a 1 id con pausa; si detecta 429, espera 60s y reintenta 1 vez."""
+    def acquire(self, n=1):
+        n = min(n, self.burst)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.t) * self.rate)
+                self.t = now
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.tokens >= n:
+                        self.tokens -= n
+                        return
+                    wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, sec):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + sec)
+
+def _backoff(attempt, retry_after):
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX)
+    return min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+def _send_batch(ids, bucket):
+    """Envía un lote respetando el bucket; reintenta con backoff solo si el lote seguro no se procesó.
+    Un 5xx, un timeout de lectura o una conexión cortada pueden venir de mensajes ya enviados: se reportan
+    con reintentar=False y el ledger no los vuelve a ofrecer."""
+    for attempt in range(MAX_RETRIES + 1):
+        bucket.acquire(len(ids))
+        exc = None
+        try:
+            ok, payload, status, retry_after = _post_notificar(ids)
+        except requests.RequestException as e:
+            ok, payload, status, retry_after, exc = False, str(e), None, None, e
+        reintentable = not ok and _reintentable(status, exc)
+        if ok or not reintentable or attempt == MAX_RETRIES:
+            return [{"id": i, "ok": ok, "resp": payload, "intentos": attempt + 1, "reintentar": reintentable}
+                    for i in ids]
+        wait = _backoff(attempt, retry_after)
+        if status in RETRY_STATUS:
+            bucket.pause(wait)  # el límite es del proveedor: frenan todos los threads
+        time.sleep(wait)
+
+def _dispatch(ids, bucket=None):
+    """Envía ids en lotes de BATCH, con CONCURRENCY requests en vuelo y a lo sumo RATE msg/s."""
+    bucket = bucket or TokenBucket(RATE, BURST)
+    lotes = [ids[i:i + BATCH] for i in range(0, len(ids), BATCH)]
     enviados = []
-    for i in ids:
-        ok, payload = _post_notificar([i])
-        if not ok and _contains_429(payload):
-            # espera y reintenta una vez
-            time.sleep(60)
-            ok2, payload2 = _post_notificar([i])
-            enviados.append({"id": i, "ok": ok2, "resp": payload2})
-        else:
-            enviados.append({"id": i, "ok": ok, "resp": payload})
-        time.sleep(pause_sec)
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as ex:
+        for res in ex.map(lambda lote: _send_batch(lote, bucket), lotes):
+            enviados.extend(res)
     return enviados
 
 # -------- Job principal --------
 def run_job():
     now = dt.datetime.now()
-    print(f"[{now}] Runner inicia. BACKEND={BACKEND} WAVES={WAVES} PAUSE={PAUSE}s DRY_RUN={DRY_RUN}")
+    print(f"[{now}] Runner inicia. BACKEND={BACKEND} WAVES={WAVES} RATE={RATE:g}/s BATCH={BATCH} "
+          f"CONCURRENCY={CONCURRENCY} DRY_RUN={DRY_RUN}")
     try:
-        data = _get_facturas()
+        _sync_plan()
+        data = _get_pendientes()
     except Exception as e:
-        print(f"[{dt.datetime.now()}] ERROR al leer /facturas: {e}")
+        print(f"[{dt.datetime.now()}] ERROR al leer /recordatorios: {e}")
+        metrics.inc("noa_worker_runs_total", {"resultado": "error"})
+        metrics.flush(force=True)
         return
 
-    # Construir buckets por días restantes
-    por_wave = {w: [] for w in WAVES}
+    # Un mensaje por cobro aunque tenga varias waves vencidas (p.ej. tras días sin correr):
+    # se envía en la wave más cercana al vencimiento y se marcan todas como enviadas.
+    por_cobro = {}
     for row in data if isinstance(data, list) else []:
-        dleft = _days_to(row.get("vence", ""))
-        if dleft in por_wave:
-            rid = row.get("id")
-            if isinstance(rid, int):
-                por_wave[dleft].append(rid)
+        por_cobro.setdefault(row["cobro_id"], []).append(row)
+    por_wave = {w: [] for w in WAVES}
+    rec_ids = {}
+    for cid, rows in por_cobro.items():
+        w = min(r["wave"] for r in rows)
+        if w in por_wave:
+            por_wave[w].append(cid)
+            rec_ids[cid] = [r["id"] for r in rows]
 
     total = 0
+    t0 = time.monotonic()
+    bucket = TokenBucket(RATE, BURST)
     for w in WAVES:
         ids = por_wave.get(w, [])
         print(f"[{dt.datetime.now()}] Wave T-{w}: {len(ids)} IDs")
         if not ids:
             continue
-        enviados = _send_ids_slow(ids, PAUSE)
-        total += len(ids)
+        tw = time.monotonic()
+        oks = 0
+        for i in range(0, len(ids), LEDGER_BATCH):
+            enviados = _dispatch(ids[i:i + LEDGER_BATCH], bucket)
+            total += len(enviados)
+            n_ok = sum(1 for x in enviados if x.get("ok"))
+            oks += n_ok
+            metrics.inc("noa_worker_waves_total", {"wave": w}, n_ok)
+            metrics.inc("noa_worker_notifications_total", {"resultado": "ok"}, n_ok)
+            metrics.inc("noa_worker_notifications_total", {"resultado": "error"}, len(enviados) - n_ok)
+            try:
+                _reportar([{"id": rid, "ok": x["ok"], "resp": x["resp"], "reintentar": x["reintentar"]}
+                           for x in enviados for rid in rec_ids[x["id"]]])
+            except Exception as e:
+                # sin ledger no hay forma de retomar sin duplicar: se corta la corrida
+                print(f"[{dt.datetime.now()}] ERROR al registrar entregas (wave T-{w}): {e}. Corrida abortada.")
+                metrics.inc("noa_worker_runs_total", {"resultado": "abortada"})
+                metrics.flush(force=True)
+                return
         # Resumen corto
-        oks = sum(1 for x in enviados if x.get("ok"))
-        print(f"[{dt.datetime.now()}] Wave T-{w} enviado(s): {oks}/{len(ids)}")
-    print(f"[{dt.datetime.now()}] Runner fin. Total IDs enviados: {total}")
+        rate = oks / max(time.monotonic() - tw, 1e-9)
+        print(f"[{dt.datetime.now()}] Wave T-{w} enviado(s): {oks}/{len(ids)} ({rate:.2f} msg/s)")
+    dur = time.monotonic() - t0
+    print(f"[{dt.datetime.now()}] Runner fin. Total IDs enviados: {total} en {dur:.1f}s "
+          f"({total / dur if dur > 0 else 0:.2f} msg/s)")
+    metrics.inc("noa_worker_runs_total", {"resultado": "ok"})
+    metrics.flush(force=True)
+
+def _serve_metrics(port):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class H(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.render().encode("utf-8") if self.path == "/metrics" else b""
+            self.send_response(200 if body else 404)
+            self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *a):
+            pass
+
+    srv = ThreadingHTTPServer(("0.0.0.0", port), H)
+    threading.Thread(target=srv.serve_forever, name="metrics", daemon=True).start()
 
 # -------- Scheduler --------
 if __name__ == "__main__":
     print(f"Scheduler en zona {TZ}. Programado a las {HOUR:02d}:{MINUTE:02d} todos los días.")
+    if os.getenv("METRICS_PORT"):
+        _serve_metrics(int(os.getenv("METRICS_PORT")))
     sch = BlockingScheduler(timezone=TZ)
     sch.add_job(run_job, "cron", hour=HOUR, minute=MINUTE)
     if RUN_ON_START: